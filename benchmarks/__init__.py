@@ -0,0 +1,6 @@
+"""Ad-hoc performance benchmarks for the game engine.
+
+These aren't part of the test suite. Run them as modules, e.g.:
+
+    python -m benchmarks.board_scaling
+"""
@@ -0,0 +1,107 @@
+"""Shows how round resolution scales with the number of pieces on the board.
+
+Every configuration uses the same piece density, so if the engine scales linearly
+the time spent per piece should stay roughly constant.
+
+Pieces only move horizontally. Push chains crossing each other at different
+distances aren't resolved by the engine yet, so we keep them out of the random boards.
+"""
+
+import argparse
+import math
+import statistics
+import time
+import uuid
+from random import Random
+
+from ld51_server.game.board import Board, PieceInformation
+from ld51_server.game.board_platform import RectangleBoardPlatform
+from ld51_server.game.board_storage import BoardStorageMode
+from ld51_server.game.coord import Coord
+from ld51_server.models import PieceAction, Position, TimelineEventAction
+
+_PIECE_DENSITY = 0.25
+_PIECES_PER_PLAYER = 3
+_MOVE_ACTIONS = (
+    PieceAction.NO_ACTION,
+    PieceAction.MOVE_LEFT,
+    PieceAction.MOVE_RIGHT,
+)
+
+
+def _build_board_and_moves(
+    rng: Random, piece_count: int, storage_mode: BoardStorageMode
+) -> tuple[Board, dict[uuid.UUID, list[TimelineEventAction]]]:
+    side = math.ceil(math.sqrt(piece_count / _PIECE_DENSITY))
+    board = Board(
+        platform=RectangleBoardPlatform(
+            top_left=Position(x=0, y=0),
+            bottom_right=Position(x=side - 1, y=side - 1),
+        ),
+        storage_mode=storage_mode,
+    )
+
+    moves_by_player: dict[uuid.UUID, list[TimelineEventAction]] = {}
+    player_id = uuid.uuid4()
+    for idx, tile_idx in enumerate(rng.sample(range(side * side), piece_count)):
+        if idx % _PIECES_PER_PLAYER == 0:
+            player_id = uuid.UUID(int=rng.getrandbits(128))
+        piece_id = uuid.UUID(int=rng.getrandbits(128))
+        y, x = divmod(tile_idx, side)
+        # bypass `place_pieces` so the setup cost doesn't depend on the platform
+        board._place_piece(  # pylint: disable=protected-access
+            Coord(x, y),
+            PieceInformation(player_id=player_id, piece_id=piece_id),
+        )
+        moves_by_player.setdefault(player_id, []).append(
+            TimelineEventAction(
+                player_id=player_id,
+                piece_id=piece_id,
+                action=rng.choice(_MOVE_ACTIONS),
+            )
+        )
+    return board, moves_by_player
+
+
+def _time_round(seed: int, piece_count: int, storage_mode: BoardStorageMode) -> float:
+    board, moves_by_player = _build_board_and_moves(
+        Random(seed), piece_count, storage_mode
+    )
+    start = time.perf_counter()
+    board.perform_all_player_moves(moves_by_player)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--pieces",
+        type=int,
+        nargs="+",
+        default=[250, 500, 1000, 2000, 4000, 8000],
+        help="piece counts to benchmark",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=51)
+    parser.add_argument(
+        "--storage-mode",
+        type=BoardStorageMode,
+        choices=list(BoardStorageMode),
+        default=BoardStorageMode.AUTO,
+    )
+    args = parser.parse_args()
+
+    print(f"{'pieces':>8} {'median ms':>10} {'us/piece':>9}")
+    for piece_count in args.pieces:
+        timings = [
+            _time_round(args.seed + run, piece_count, args.storage_mode)
+            for run in range(args.repeat)
+        ]
+        median = statistics.median(timings)
+        print(
+            f"{piece_count:>8} {median * 1e3:>10.2f} {median / piece_count * 1e6:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Cost of broadcasting a message to every player in a lobby.
+
+Compares encoding the message for every player (what `Player.send_msg` does for a
+single recipient) with the shared frame `Lobby._broadcast` encodes once.
+The websockets don't go anywhere, so only the server side of sending is measured.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from random import Random
+from typing import Any, Awaitable, Callable
+
+from starlette.types import Message as AsgiMessage
+from starlette.websockets import WebSocket, WebSocketState
+
+from ld51_server.game.lobby import Lobby
+from ld51_server.game.player import Player
+from ld51_server.models import (
+    Direction,
+    PieceAction,
+    PlayerPiecePosition,
+    Position,
+    PushOutcome,
+    PushOutcomePayload,
+    TimelineEvent,
+    TimelineEventAction,
+)
+from ld51_server.protocol import (
+    BaseMessage,
+    RoundResultMessage,
+    RoundResultPayload,
+    RoundStartMessage,
+    RoundStartPayload,
+)
+
+_PIECES_PER_PLAYER = 3
+
+
+async def _receive() -> AsgiMessage:
+    raise NotImplementedError
+
+
+async def _send(_message: AsgiMessage) -> None:
+    pass
+
+
+def _connected_ws() -> WebSocket:
+    ws = WebSocket({"type": "websocket", "path": "/", "headers": []}, _receive, _send)
+    ws.application_state = WebSocketState.CONNECTED
+    return ws
+
+
+def _round_start_msg(rng: Random, player_ids: list[uuid.UUID]) -> RoundStartMessage:
+    return RoundStartMessage.from_payload(
+        RoundStartPayload(
+            round_number=1,
+            round_duration=10.0,
+            board_version=1,
+            board_state=[
+                PlayerPiecePosition(
+                    player_id=player_id,
+                    piece_id=uuid.UUID(int=rng.getrandbits(128)),
+                    position=Position(x=rng.randrange(100), y=rng.randrange(100)),
+                )
+                for player_id in player_ids
+                for _ in range(_PIECES_PER_PLAYER)
+            ],
+        )
+    )
+
+
+def _round_result_msg(rng: Random, player_ids: list[uuid.UUID]) -> RoundResultMessage:
+    timeline: list[TimelineEvent] = []
+    for player_id in player_ids:
+        piece_id = uuid.UUID(int=rng.getrandbits(128))
+        timeline.append(
+            TimelineEvent(
+                actions=[
+                    TimelineEventAction(
+                        player_id=player_id,
+                        piece_id=piece_id,
+                        action=PieceAction.MOVE_RIGHT,
+                    )
+                ],
+                outcomes=[
+                    PushOutcome.build(
+                        PushOutcomePayload(
+                            pusher_piece_id=piece_id,
+                            victim_piece_ids=[uuid.UUID(int=rng.getrandbits(128))],
+                            direction=Direction.RIGHT,
+                        )
+                    )
+                ],
+            )
+        )
+    return RoundResultMessage.from_payload(
+        RoundResultPayload(timeline=timeline, game_over=None)
+    )
+
+
+_MESSAGES: dict[str, Callable[[Random, list[uuid.UUID]], BaseMessage[Any, Any]]] = {
+    "round_start": _round_start_msg,
+    "round_result": _round_result_msg,
+}
+
+
+async def _mean_duration(send: Callable[[], Awaitable[None]], repeat: int) -> float:
+    timings: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await send()
+        timings.append(time.perf_counter() - start)
+    return statistics.fmean(timings)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    rng = Random(51)
+    print(
+        f"{'message':<14} {'players':>8} {'per player ms':>14}"
+        f" {'shared ms':>10} {'speedup':>8}"
+    )
+    for msg_name, build_msg in _MESSAGES.items():
+        for player_count in args.players:
+            lobby = Lobby()
+            players = [
+                Player(_connected_ws(), player_number=number)
+                for number in range(1, player_count + 1)
+            ]
+            # pylint: disable-next=protected-access
+            lobby._player_by_id = {player.player_id: player for player in players}
+            msg = build_msg(rng, [player.player_id for player in players])
+
+            async def per_player() -> None:
+                await asyncio.gather(*(player.send_msg(msg) for player in players))
+
+            async def shared() -> None:
+                await lobby._broadcast(msg)  # pylint: disable=protected-access
+
+            per_player_mean = await _mean_duration(per_player, args.repeat)
+            shared_mean = await _mean_duration(shared, args.repeat)
+            print(
+                f"{msg_name:<14} {player_count:>8} {per_player_mean * 1e3:>14.3f}"
+                f" {shared_mean * 1e3:>10.3f} {per_player_mean / shared_mean:>7.1f}x"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--players",
+        type=int,
+        nargs="+",
+        default=[2, 10, 50],
+        help="lobby sizes to measure",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
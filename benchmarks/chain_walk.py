@@ -0,0 +1,79 @@
+"""Microbenchmark of walking a single long push chain.
+
+Compares the previous approach (pydantic `Position` keys, a new model for every step)
+with the `Coord` based piece storages used by the engine now.
+"""
+
+import argparse
+import timeit
+import uuid
+
+from ld51_server.game.board_storage import (
+    DensePieceStorage,
+    PieceInformation,
+    PieceStorageABC,
+    SparsePieceStorage,
+)
+from ld51_server.game.coord import Coord
+from ld51_server.models import Direction, Position
+
+
+def _walk_chain_position(
+    piece_by_position: dict[Position, PieceInformation],
+    pos: Position,
+    direction: Direction,
+) -> list[PieceInformation]:
+    chain: list[PieceInformation] = []
+    while True:
+        pos = pos.offset_in_direction(direction)
+        piece = piece_by_position.get(pos)
+        if piece is None:
+            return chain
+        chain.append(piece)
+
+
+def _fill_storage(storage: PieceStorageABC, length: int) -> None:
+    for x in range(length):
+        storage[Coord(x, 0)] = PieceInformation(
+            player_id=uuid.uuid4(), piece_id=uuid.uuid4()
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--length", type=int, default=1000, help="chain length")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    length: int = args.length
+
+    piece_by_position = {
+        Position(x=x, y=0): PieceInformation(
+            player_id=uuid.uuid4(), piece_id=uuid.uuid4()
+        )
+        for x in range(length)
+    }
+    sparse = SparsePieceStorage()
+    _fill_storage(sparse, length)
+    dense = DensePieceStorage(Coord(0, 0), Coord(length, 0))
+    _fill_storage(dense, length)
+
+    candidates = {
+        "position (before)": lambda: _walk_chain_position(
+            piece_by_position, Position(x=-1, y=0), Direction.RIGHT
+        ),
+        "coord sparse": lambda: sparse.walk_chain(Coord(-1, 0), Direction.RIGHT),
+        "coord dense": lambda: dense.walk_chain(Coord(0, 0), Direction.RIGHT),
+    }
+
+    baseline: float | None = None
+    print(f"{'variant':<18} {'ns/step':>8} {'speedup':>8}")
+    for name, func in candidates.items():
+        total = min(timeit.repeat(func, number=args.number, repeat=5))
+        per_step = total / args.number / length
+        if baseline is None:
+            baseline = per_step
+        print(f"{name:<18} {per_step * 1e9:>8.1f} {baseline / per_step:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
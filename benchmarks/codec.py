@@ -0,0 +1,100 @@
+"""Encode and decode time and frame size of a round start message with the available codecs.
+
+`jsonable_encoder` is what `Player.send_msg` used before the codecs existed.
+"""
+
+import argparse
+import json
+import time
+import uuid
+from random import Random
+from typing import Any, Callable
+
+from fastapi.encoders import jsonable_encoder
+
+from ld51_server.models import PlayerPiecePosition, Position
+from ld51_server.protocol import Message, RoundStartMessage, RoundStartPayload
+from ld51_server.protocol import codec as codec_module
+from ld51_server.protocol.codec import CodecABC, JsonCodec, MsgpackCodec, OrjsonCodec
+from ld51_server.protocol.compression import compress_frame, decompress_frame
+
+
+def _build_msg(pieces: int) -> RoundStartMessage:
+    rng = Random(51)
+    return RoundStartMessage.from_payload(
+        RoundStartPayload(
+            round_number=1,
+            round_duration=10.0,
+            board_version=1,
+            board_state=[
+                PlayerPiecePosition(
+                    player_id=uuid.UUID(int=rng.getrandbits(128)),
+                    piece_id=uuid.UUID(int=rng.getrandbits(128)),
+                    position=Position(x=rng.randrange(100), y=rng.randrange(100)),
+                )
+                for _ in range(pieces)
+            ],
+        )
+    )
+
+
+def _per_call_us(func: Callable[[], Any], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pieces", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    codecs: list[CodecABC] = [JsonCodec()]
+    if codec_module.orjson is not None:
+        codecs.append(OrjsonCodec())
+    if codec_module.msgpack is not None:
+        codecs.append(MsgpackCodec())
+
+    print(
+        f"{'codec':<18} {'pieces':>7} {'encode us':>10} {'decode us':>10}"
+        f" {'bytes':>8}"
+    )
+    for pieces in args.pieces:
+        msg = _build_msg(pieces)
+        raw = json.dumps(jsonable_encoder(msg))
+        encode_us = _per_call_us(lambda: json.dumps(jsonable_encoder(msg)), args.repeat)
+        decode_us = _per_call_us(
+            lambda: Message.parse_obj(json.loads(raw)), args.repeat
+        )
+        print(
+            f"{'jsonable_encoder':<18} {pieces:>7} {encode_us:>10.1f} {decode_us:>10.1f}"
+            f" {len(raw.encode()):>8}"
+        )
+        for codec in codecs:
+            raw = codec.encode(msg)
+            encode_us = _per_call_us(lambda: codec.encode(msg), args.repeat)
+            decode_us = _per_call_us(lambda: codec.decode(raw), args.repeat)
+            size = len(raw.encode() if isinstance(raw, str) else raw)
+            print(
+                f"{type(codec).__name__:<18} {pieces:>7}"
+                f" {encode_us:>10.1f} {decode_us:>10.1f} {size:>8}"
+            )
+        if codec_module.msgpack is not None:
+            codec = MsgpackCodec()
+            raw = compress_frame(codec.encode(msg), threshold=0)
+            encode_us = _per_call_us(
+                lambda: compress_frame(codec.encode(msg), threshold=0), args.repeat
+            )
+            decode_us = _per_call_us(
+                lambda: codec.decode(decompress_frame(raw)), args.repeat
+            )
+            print(
+                f"{'MsgpackCodec+zlib':<18} {pieces:>7}"
+                f" {encode_us:>10.1f} {decode_us:>10.1f} {len(raw):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Benchmarks the engine on the scenarios from the test corpus.
+
+Every scenario in `tests/data/board_states` is resolved on its own and, to get
+boards with tens of thousands of pieces, tiled across large square boards
+(row by row until the board or the piece budget is full).
+Timings are written to a JSON file, use `compare` to check two such files for regressions:
+
+    python -m benchmarks.corpus run --output before.json
+    python -m benchmarks.corpus run --output after.json
+    python -m benchmarks.corpus compare before.json after.json
+"""
+
+import argparse
+import dataclasses
+import json
+import platform
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from random import Random
+from typing import Any, Callable
+
+from ld51_server.game import board as board_module
+from ld51_server.game.board import Board, PieceInformation
+from ld51_server.game.board_platform import RectangleBoardPlatform
+from ld51_server.game.coord import Coord
+from ld51_server.models import Position, TimelineEventAction
+from tests.ascii_board import DUMMY_PLAYER_ID, AsciiStateAndMoves
+
+BOARD_STATES_DIR = Path(__file__).parent.parent / "tests" / "data" / "board_states"
+
+# empty columns / rows between tiled copies so they can't interact
+_TILE_GAP = 2
+
+_BoardFactory = Callable[[], tuple[Board, list[TimelineEventAction]]]
+
+
+@dataclasses.dataclass(kw_only=True)
+class _Scenario:
+    name: str
+    ascii_state: AsciiStateAndMoves
+
+
+def _load_scenarios(pattern: str) -> list[_Scenario]:
+    scenarios: list[_Scenario] = []
+    for path in sorted(BOARD_STATES_DIR.glob(f"{pattern}.txt")):
+        raw_before, _, _ = path.read_text("utf-8").strip("\n").partition("\n---\n")
+        scenarios.append(
+            _Scenario(name=path.stem, ascii_state=AsciiStateAndMoves.parse(raw_before))
+        )
+    return scenarios
+
+
+def _single_board_factory(scenario: _Scenario) -> _BoardFactory:
+    def factory() -> tuple[Board, list[TimelineEventAction]]:
+        state_and_moves = scenario.ascii_state.to_board_state_and_moves()
+        return state_and_moves.board_state, state_and_moves.get_validated_moves()
+
+    return factory
+
+
+def _tiled_board_factory(
+    scenario: _Scenario, side: int, max_pieces: int
+) -> _BoardFactory | None:
+    """Copies of the scenario on a `side` x `side` board, `None` if not even one fits."""
+    state = scenario.ascii_state
+    tiles_x = side // (state.width + _TILE_GAP)
+    tiles_y = side // (state.height + _TILE_GAP)
+    pieces_per_tile = sum(cell.has_piece() for row in state.board_grid for cell in row)
+    tile_count = min(tiles_x * tiles_y, max_pieces // max(pieces_per_tile, 1))
+    if not tile_count:
+        return None
+
+    def factory() -> tuple[Board, list[TimelineEventAction]]:
+        rng = Random(side)
+        board = Board(
+            platform=RectangleBoardPlatform(
+                top_left=Position(x=0, y=0),
+                bottom_right=Position(x=side - 1, y=side - 1),
+            )
+        )
+        moves: list[TimelineEventAction] = []
+        for tile in range(tile_count):
+            tile_y, tile_x = divmod(tile, tiles_x)
+            origin_x = tile_x * (state.width + _TILE_GAP)
+            origin_y = tile_y * (state.height + _TILE_GAP)
+            for y, row in enumerate(state.board_grid):
+                for x, cell in enumerate(row):
+                    if not cell.has_piece():
+                        continue
+                    piece_id = uuid.UUID(int=rng.getrandbits(128))
+                    # bypass `place_pieces`, we want the exact layout of the scenario
+                    board._place_piece(  # pylint: disable=protected-access
+                        Coord(origin_x + x, origin_y + y),
+                        PieceInformation(player_id=DUMMY_PLAYER_ID, piece_id=piece_id),
+                    )
+                    if move := cell.to_player_move(piece_id):
+                        moves.append(
+                            TimelineEventAction(
+                                player_id=DUMMY_PLAYER_ID,
+                                piece_id=piece_id,
+                                action=move.action,
+                            )
+                        )
+        return board, moves
+
+    return factory
+
+
+def _perform_player_moves(board: Board, moves: list[TimelineEventAction]) -> None:
+    board.perform_player_moves(moves)
+
+
+def _perform_all_player_moves(board: Board, moves: list[TimelineEventAction]) -> None:
+    board.perform_all_player_moves({DUMMY_PLAYER_ID: moves})
+
+
+_OPERATIONS: dict[str, Callable[[Board, list[TimelineEventAction]], None]] = {
+    "perform_player_moves": _perform_player_moves,
+    "perform_all_player_moves": _perform_all_player_moves,
+}
+
+
+def _percentile(sorted_timings: list[float], fraction: float) -> float:
+    idx = round(fraction * (len(sorted_timings) - 1))
+    return sorted_timings[idx]
+
+
+def _measure(
+    factory: _BoardFactory,
+    operation: Callable[[Board, list[TimelineEventAction]], None],
+    repeat: int,
+) -> dict[str, Any]:
+    timings: list[float] = []
+    pieces = 0
+    for _ in range(repeat):
+        # building the board isn't part of the measurement
+        board, moves = factory()
+        pieces = len(board.get_pieces_model())
+        start = time.perf_counter()
+        operation(board, moves)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        "pieces": pieces,
+        "runs": repeat,
+        "ops_per_sec": 1.0 / mean if mean else float("inf"),
+        "mean_ms": mean * 1e3,
+        "p50_ms": _percentile(timings, 0.5) * 1e3,
+        "p90_ms": _percentile(timings, 0.9) * 1e3,
+        "p99_ms": _percentile(timings, 0.99) * 1e3,
+    }
+
+
+def _run(args: argparse.Namespace) -> None:
+    scenarios = _load_scenarios(args.scenarios)
+    if not scenarios:
+        sys.exit(f"no scenarios matching {args.scenarios!r}")
+
+    cases: list[tuple[str, _BoardFactory, int]] = []
+    for scenario in scenarios:
+        cases.append((scenario.name, _single_board_factory(scenario), args.repeat))
+        for side in args.sizes:
+            if factory := _tiled_board_factory(scenario, side, args.max_pieces):
+                cases.append(
+                    (f"{scenario.name}@{side}x{side}", factory, args.tiled_repeat)
+                )
+
+    results: dict[str, dict[str, Any]] = {}
+    print(f"{'case':<60} {'pieces':>7} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for case_name, factory, repeat in cases:
+        for op_name, operation in _OPERATIONS.items():
+            name = f"{case_name}/{op_name}"
+            result = results[name] = _measure(factory, operation, repeat)
+            print(
+                f"{name:<60} {result['pieces']:>7} {result['ops_per_sec']:>10.1f}"
+                f" {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}"
+            )
+
+    output: Path = args.output
+    output.write_text(
+        json.dumps(
+            {
+                "meta": {
+                    "created_at": time.time(),
+                    "python": platform.python_version(),
+                    "vectorized": board_module.board_vectorized is not None,
+                    "repeat": args.repeat,
+                    "tiled_repeat": args.tiled_repeat,
+                    "max_pieces": args.max_pieces,
+                },
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"wrote {len(results)} results to {output}")
+
+
+def _compare(args: argparse.Namespace) -> None:
+    baseline = json.loads(Path(args.baseline).read_text())["results"]
+    current = json.loads(Path(args.current).read_text())["results"]
+    metric: str = args.metric
+    threshold: float = args.threshold
+
+    regressions = 0
+    print(f"{'case':<60} {'before':>9} {'after':>9} {'change':>8}")
+    for name in sorted(baseline.keys() & current.keys()):
+        before = baseline[name][metric]
+        after = current[name][metric]
+        change = after / before - 1.0 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<60} {before:>9.3f} {after:>9.3f} {change:>+7.1%}{flag}")
+
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:<60} missing from {args.current}")
+
+    if regressions:
+        sys.exit(f"{regressions} case(s) got more than {threshold:.0%} slower")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.set_defaults(func=_run)
+    run_parser.add_argument(
+        "--scenarios", default="*", help="glob matching the scenario names"
+    )
+    run_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[100, 1000],
+        help="side lengths of the boards the scenarios are tiled across",
+    )
+    run_parser.add_argument(
+        "--max-pieces",
+        type=int,
+        default=20_000,
+        help="upper limit for the number of pieces on the tiled boards",
+    )
+    run_parser.add_argument("--repeat", type=int, default=200)
+    run_parser.add_argument(
+        "--tiled-repeat",
+        type=int,
+        default=5,
+        help="repetitions for the tiled boards",
+    )
+    run_parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="flag regressions between two result files"
+    )
+    compare_parser.set_defaults(func=_compare)
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--metric",
+        choices=["mean_ms", "p50_ms", "p90_ms", "p99_ms"],
+        default="p50_ms",
+    )
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown to flag, 0.1 is 10%%",
+    )
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
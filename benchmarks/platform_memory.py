@@ -0,0 +1,89 @@
+"""Memory held by a client defined platform after the model it was built from is gone.
+
+Compares the previous representation (every tile model kept in a dict by position plus
+a set of on-board positions) with the palette grid used by `ClientDefinedPlatform` now.
+"""
+
+import argparse
+import gc
+import tracemalloc
+from random import Random
+from typing import Any, Callable
+
+from ld51_server.game.board_platform import ClientDefinedPlatform
+from ld51_server.game.coord import Coord
+from ld51_server.models import (
+    BoardPlatform,
+    BoardPlatformTile,
+    BoardPlatformTileType,
+    Position,
+)
+
+_TEXTURES = ("grass", "sand", "stone", "water")
+
+
+def _build_model(side: int, seed: int) -> BoardPlatform:
+    rng = Random(seed)
+    return BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=y),
+                texture_id=rng.choice(_TEXTURES),
+                tile_type=BoardPlatformTileType.VOID
+                if rng.random() < 0.1
+                else BoardPlatformTileType.FLOOR,
+            )
+            for y in range(side)
+            for x in range(side)
+        ]
+    )
+
+
+def _build_dict_and_set(model: BoardPlatform) -> Any:
+    tile_by_pos = {tile.position: tile for tile in model.tiles}
+    on_board_positions = {
+        Coord.from_position(tile.position)
+        for tile in model.tiles
+        if not tile.tile_type.is_off_board()
+    }
+    return tile_by_pos, on_board_positions
+
+
+def _retained_bytes(
+    side: int, seed: int, build: Callable[[BoardPlatform], Any]
+) -> tuple[int, Any]:
+    gc.collect()
+    tracemalloc.start()
+    model = _build_model(side, seed)
+    platform = build(model)
+    del model
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, platform
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sides",
+        type=int,
+        nargs="+",
+        default=[64, 256, 512],
+        help="side lengths of the square platforms",
+    )
+    parser.add_argument("--seed", type=int, default=51)
+    args = parser.parse_args()
+
+    print(f"{'tiles':>8} {'dict+set MiB':>13} {'palette MiB':>12} {'ratio':>7}")
+    for side in args.sides:
+        before, _ = _retained_bytes(side, args.seed, _build_dict_and_set)
+        after, _ = _retained_bytes(side, args.seed, ClientDefinedPlatform)
+        print(
+            f"{side * side:>8} {before / 2**20:>13.2f} {after / 2**20:>12.3f}"
+            f" {before / after:>6.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Searches generated scenarios for the ones that take the longest to resolve.
+
+Scenarios come from `tests/scenario_generator.py`. The slowest ones and every
+scenario the engine fails on can be saved as regression cases, e.g.:
+
+    python -m benchmarks.stress --kinds cascade converging --save-dir tests/data/board_states
+
+Slow cases are written in the format of `tests/data/board_states` with the
+current result as the expected state. Failures don't have a known result, they
+get the `.failing` suffix instead so the test suite doesn't pick them up.
+"""
+
+import argparse
+import dataclasses
+import time
+from pathlib import Path
+
+from ld51_server.game.board_storage import BoardStorageMode
+from tests.ascii_board import AsciiStateAndMoves
+from tests.scenario_generator import ScenarioKind, generate_scenario
+
+
+@dataclasses.dataclass(kw_only=True)
+class _Case:
+    name: str
+    before: AsciiStateAndMoves
+    after: AsciiStateAndMoves | None = None
+    duration: float = 0.0
+    error: str | None = None
+
+
+def _run_case(case: _Case, storage_mode: BoardStorageMode) -> None:
+    state_and_moves = case.before.to_board_state_and_moves(storage_mode=storage_mode)
+    moves = state_and_moves.get_validated_moves()
+    start = time.perf_counter()
+    try:
+        state_and_moves.board_state.perform_player_moves(moves)
+    # we want to collect everything that makes the engine fail
+    # pylint: disable-next=broad-except
+    except Exception as exc:
+        case.error = f"{type(exc).__name__}: {exc}"
+        return
+    finally:
+        case.duration = time.perf_counter() - start
+
+    case.after = AsciiStateAndMoves.from_board_state(
+        state_and_moves.board_state,
+        width=case.before.width,
+        height=case.before.height,
+    )
+
+
+def _save_case(case: _Case, save_dir: Path) -> Path:
+    content = f"# {case.name}\n" + case.before.render(with_border=False)
+    if case.after is None:
+        path = save_dir / f"{case.name}.txt.failing"
+        content = f"# {case.error}\n{content}"
+    else:
+        path = save_dir / f"{case.name}.txt"
+        content += "\n---\n" + case.after.render(with_border=False)
+    path.write_text(content + "\n", "utf-8")
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--kinds",
+        type=ScenarioKind,
+        nargs="+",
+        choices=list(ScenarioKind),
+        default=list(ScenarioKind),
+    )
+    parser.add_argument("--seeds", type=int, default=20, help="seeds per kind")
+    parser.add_argument("--width", type=int, default=100)
+    parser.add_argument("--height", type=int, default=100)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument(
+        "--storage-mode",
+        type=BoardStorageMode,
+        choices=list(BoardStorageMode),
+        default=BoardStorageMode.AUTO,
+    )
+    parser.add_argument(
+        "--keep", type=int, default=3, help="number of slowest cases to report"
+    )
+    parser.add_argument(
+        "--save-dir", type=Path, help="write the slowest and failing cases here"
+    )
+    args = parser.parse_args()
+
+    cases: list[_Case] = []
+    for kind in args.kinds:
+        for seed in range(args.seeds):
+            case = _Case(
+                name=f"generated-{kind.value}-{args.width}x{args.height}-{seed}",
+                before=generate_scenario(
+                    kind,
+                    width=args.width,
+                    height=args.height,
+                    seed=seed,
+                    density=args.density,
+                ),
+            )
+            _run_case(case, args.storage_mode)
+            cases.append(case)
+
+    failures = [case for case in cases if case.error is not None]
+    slowest = sorted(
+        (case for case in cases if case.error is None),
+        key=lambda case: case.duration,
+        reverse=True,
+    )[: args.keep]
+
+    print(f"{'case':<48} {'ms':>10}")
+    for case in slowest:
+        print(f"{case.name:<48} {case.duration * 1e3:>10.2f}")
+    for case in failures:
+        print(f"{case.name:<48} {'failed':>10}  {case.error}")
+
+    if args.save_dir is not None:
+        args.save_dir.mkdir(parents=True, exist_ok=True)
+        for case in (*slowest, *failures):
+            print(f"saved {_save_case(case, args.save_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
-from . import lobby, protocol
+from . import lobby, metrics, protocol
 
 router = APIRouter(prefix="/dev-tools", tags=["dev-tools"])
 
 router.include_router(lobby.router)
+router.include_router(metrics.router)
 router.include_router(protocol.router)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from ..protocol.compression import COMPRESSION_STATS, COMPRESSION_THRESHOLD
+
+router = APIRouter(prefix="/metrics", tags=["dev-tools"])
+
+
+class CompressionMetrics(BaseModel):
+    threshold: int
+    frames: int
+    compressed_frames: int
+    raw_bytes: int
+    compressed_bytes: int
+    ratio: float
+    cpu_seconds: float
+
+
+@router.get("/compression", response_model=CompressionMetrics)
+async def get_compression_metrics():
+    return CompressionMetrics(
+        threshold=COMPRESSION_THRESHOLD,
+        frames=COMPRESSION_STATS.frames,
+        compressed_frames=COMPRESSION_STATS.compressed_frames,
+        raw_bytes=COMPRESSION_STATS.raw_bytes,
+        compressed_bytes=COMPRESSION_STATS.compressed_bytes,
+        ratio=COMPRESSION_STATS.ratio,
+        cpu_seconds=COMPRESSION_STATS.cpu_seconds,
+    )
@@ -2,7 +2,9 @@ import dataclasses
 import itertools
 import typing
 import uuid
+from array import array
 from random import Random
+from typing import MutableMapping
 
 from ..models import (
     Direction,
@@ -20,16 +22,25 @@ from ..models import (
     TimelineEventAction,
 )
 from .board_platform import BoardPlatformABC
+from .board_storage import (
+    BoardStorageMode,
+    DensePieceStorage,
+    PieceInformation,
+    PieceStorageABC,
+    create_piece_storage,
+    fork_piece_storage,
+)
+from .coord import Coord
+from .layered_dict import LayeredDict
+from .push_chains import PushChainCache
 
+try:
+    from . import board_vectorized
+except ImportError:  # numpy isn't installed
+    board_vectorized = None
 
-@dataclasses.dataclass(kw_only=True)
-class PieceInformation:
-    player_id: uuid.UUID
-    piece_id: uuid.UUID
-
-    @classmethod
-    def from_player_piece_position(cls, piece: PlayerPiecePosition):
-        return cls(player_id=piece.player_id, piece_id=piece.piece_id)
+# below this many moves the overhead of setting up the vectorized resolver isn't worth it
+VECTORIZED_MIN_MOVES: int = 256
 
 
 @dataclasses.dataclass(kw_only=True)
@@ -42,92 +53,164 @@ class PlayerMovesExhaustedError(Exception):
     ...
 
 
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class PackedPieces:
+    """All pieces of a board in a compact, picklable form."""
+
+    player_ids: list[uuid.UUID]
+    # 16 bytes per piece
+    piece_ids: bytes
+    # index into `player_ids` for every piece
+    owners: "array[int]"
+    # x and y for every piece
+    positions: "array[int]"
+
+
 class Board:
     _platform: BoardPlatformABC
-    _piece_by_position: dict[Position, PieceInformation]
+    _piece_by_position: PieceStorageABC
+    # indices over `_piece_by_position`, kept in sync by `_place_piece` / `_remove_piece`
+    _position_by_piece_id: MutableMapping[uuid.UUID, Coord]
+    _piece_count_by_player: dict[uuid.UUID, int]
 
-    def __init__(self, *, platform: BoardPlatformABC) -> None:
+    def __init__(
+        self,
+        *,
+        platform: BoardPlatformABC,
+        storage_mode: BoardStorageMode = BoardStorageMode.AUTO,
+    ) -> None:
         self._platform = platform
-        self._piece_by_position = {}
+        self._piece_by_position = create_piece_storage(
+            storage_mode, platform.get_bounds()
+        )
+        self._position_by_piece_id = {}
+        self._piece_count_by_player = {}
+
+    @property
+    def platform(self) -> BoardPlatformABC:
+        return self._platform
+
+    def pack_pieces(self) -> PackedPieces:
+        player_idx_by_id = {
+            player_id: idx for idx, player_id in enumerate(self._piece_count_by_player)
+        }
+        piece_ids = bytearray()
+        owners = array("I")
+        positions = array("q")
+        for pos, piece in self._piece_by_position.items():
+            piece_ids += piece.piece_id.bytes
+            owners.append(player_idx_by_id[piece.player_id])
+            positions.extend(pos)
+        return PackedPieces(
+            player_ids=list(player_idx_by_id),
+            piece_ids=bytes(piece_ids),
+            owners=owners,
+            positions=positions,
+        )
+
+    @classmethod
+    def from_packed_pieces(
+        cls,
+        packed: PackedPieces,
+        *,
+        platform: BoardPlatformABC,
+        storage_mode: BoardStorageMode = BoardStorageMode.AUTO,
+    ) -> "Board":
+        board = cls(platform=platform, storage_mode=storage_mode)
+        for idx, owner in enumerate(packed.owners):
+            board._place_piece(
+                Coord(packed.positions[2 * idx], packed.positions[2 * idx + 1]),
+                PieceInformation(
+                    player_id=packed.player_ids[owner],
+                    piece_id=uuid.UUID(
+                        bytes=packed.piece_ids[16 * idx : 16 * idx + 16]
+                    ),
+                ),
+            )
+        return board
+
+    def snapshot(self) -> "Board":
+        """Create an independent copy of the board, e.g. to simulate moves on.
+
+        Both boards share the pieces placed so far and only record their own changes from
+        here on, so this only costs as much as the changes since the previous snapshot.
+        """
+        fork = Board(platform=self._platform, storage_mode=BoardStorageMode.SPARSE)
+        self._piece_by_position, fork._piece_by_position = fork_piece_storage(
+            self._piece_by_position
+        )
+        self._position_by_piece_id, fork._position_by_piece_id = LayeredDict.fork(
+            self._position_by_piece_id
+        )
+        fork._piece_count_by_player = self._piece_count_by_player.copy()
+        return fork
+
+    def _place_piece(self, pos: Coord, piece: PieceInformation) -> None:
+        assert pos not in self._piece_by_position
+        self._piece_by_position[pos] = piece
+        self._position_by_piece_id[piece.piece_id] = pos
+        self._piece_count_by_player[piece.player_id] = (
+            self._piece_count_by_player.get(piece.player_id, 0) + 1
+        )
+
+    def _remove_piece(self, pos: Coord) -> PieceInformation:
+        piece = self._piece_by_position.pop(pos)
+        del self._position_by_piece_id[piece.piece_id]
+        piece_count = self._piece_count_by_player.pop(piece.player_id) - 1
+        if piece_count:
+            self._piece_count_by_player[piece.player_id] = piece_count
+        return piece
+
+    @staticmethod
+    def _piece_model(pos: Coord, info: PieceInformation) -> PlayerPiecePosition:
+        return PlayerPiecePosition(
+            player_id=info.player_id,
+            piece_id=info.piece_id,
+            position=pos.to_position(),
+        )
 
     def get_piece_by_id(self, piece_id: uuid.UUID) -> PlayerPiecePosition | None:
-        for pos, info in self._piece_by_position.items():
-            if info.piece_id == piece_id:
-                return PlayerPiecePosition(**dataclasses.asdict(info), position=pos)
-        return None
+        pos = self._position_by_piece_id.get(piece_id)
+        if pos is None:
+            return None
+        return self._piece_model(pos, self._piece_by_position[pos])
 
     def get_piece_at_position(self, pos: Position) -> PlayerPiecePosition | None:
-        info = self._piece_by_position.get(pos)
+        coord = Coord.from_position(pos)
+        info = self._piece_by_position.get(coord)
         if info is None:
             return None
-        return PlayerPiecePosition(**dataclasses.asdict(info), position=pos)
+        return self._piece_model(coord, info)
 
     def get_pieces_model(self) -> list[PlayerPiecePosition]:
-        pieces: list[PlayerPiecePosition] = []
-        for pos, info in self._piece_by_position.items():
-            piece = PlayerPiecePosition(**dataclasses.asdict(info), position=pos)
-            pieces.append(piece)
-        return pieces
-
-    def _execute_push_outcomes(self, pushes: list[PushOutcomePayload]) -> None:
+        return [
+            self._piece_model(pos, info)
+            for pos, info in self._piece_by_position.items()
+        ]
+
+    def _execute_push_outcomes(self, pushes: list[PushOutcomePayload]) -> set[Coord]:
+        """Returns all positions that were vacated or occupied."""
+        changed_positions: set[Coord] = set()
         if not pushes:
-            return
+            return changed_positions
 
-        temp_piece_by_positions: dict[Position, PieceInformation] = {}
+        temp_piece_by_positions: dict[Coord, PieceInformation] = {}
         for push_outcome in pushes:
             piece_ids = (push_outcome.pusher_piece_id, *push_outcome.victim_piece_ids)
             for piece_id in piece_ids:
-                info = self.get_piece_by_id(piece_id)
-                assert info is not None
-                old_pos = info.position
+                old_pos = self._position_by_piece_id[piece_id]
                 new_pos = old_pos.offset_in_direction(push_outcome.direction)
                 assert new_pos not in temp_piece_by_positions
-                piece = self._piece_by_position.pop(old_pos)
+                piece = self._remove_piece(old_pos)
+                changed_positions.add(old_pos)
                 if self._platform.is_position_on_board(new_pos):
                     # only keep the piece around if the new pos is still on the board
                     temp_piece_by_positions[new_pos] = piece
 
-        for new_pos in temp_piece_by_positions:
-            assert new_pos not in self._piece_by_position
-        self._piece_by_position.update(temp_piece_by_positions)
-
-    def _isolate_complete_push_chains(
-        self,
-        remaining_moves_by_piece_id: dict[uuid.UUID, Direction],
-        complete_push_chains: dict[uuid.UUID, list[uuid.UUID]],
-    ) -> int:
-        incomple_push_chains: dict[uuid.UUID, list[uuid.UUID]] = {}
-
-        victim_chain_length = -1
-        while remaining_moves_by_piece_id:
-            victim_chain_length += 1
-            finished = False
-            for pusher_piece_id, push_dir in remaining_moves_by_piece_id.copy().items():
-                pusher_piece = self.get_piece_by_id(pusher_piece_id)
-                if pusher_piece is None:
-                    # this piece no longer exists
-                    del remaining_moves_by_piece_id[pusher_piece_id]
-                    continue
-                try:
-                    push_chain = incomple_push_chains[pusher_piece_id]
-                except KeyError:
-                    push_chain = incomple_push_chains[pusher_piece_id] = [
-                        pusher_piece_id
-                    ]
-                victim_pos = pusher_piece.position.offset_in_direction(
-                    push_dir, steps=victim_chain_length + 1
-                )
-                victim_piece = self.get_piece_at_position(victim_pos)
-                if victim_piece is not None:
-                    push_chain.append(victim_piece.piece_id)
-                    continue
-
-                complete_push_chains[pusher_piece_id] = push_chain
-                finished = True
-
-            if finished:
-                break
-        return victim_chain_length
+        for new_pos, piece in temp_piece_by_positions.items():
+            self._place_piece(new_pos, piece)
+        changed_positions.update(temp_piece_by_positions)
+        return changed_positions
 
     def _find_push_conflicts(
         self,
@@ -222,11 +305,12 @@ class Board:
         self,
         action_by_piece_id: dict[uuid.UUID, TimelineEventAction],
         remaining_moves_by_piece_id: dict[uuid.UUID, Direction],
+        push_chains: PushChainCache,
     ) -> TimelineEvent:
         event = TimelineEvent(actions=[], outcomes=[])
         complete_push_chains: dict[uuid.UUID, list[uuid.UUID]] = {}
-        victim_chain_length = self._isolate_complete_push_chains(
-            remaining_moves_by_piece_id, complete_push_chains
+        victim_chain_length = push_chains.isolate_complete_push_chains(
+            complete_push_chains
         )
 
         if not complete_push_chains:
@@ -238,18 +322,15 @@ class Board:
             for outcome in collision_outcomes:
                 for piece_id in outcome.piece_ids:
                     event.actions.append(action_by_piece_id[piece_id])
-                    del remaining_moves_by_piece_id[piece_id]
+                    push_chains.remove(piece_id)
                 event.outcomes.append(PushConflictOutcome.build(outcome))
             return event
 
-        target_pos_to_pushers: dict[Position, list[uuid.UUID]] = {}
+        target_pos_to_pushers: dict[Coord, list[uuid.UUID]] = {}
         for pusher_piece_id, push_chain in complete_push_chains.items():
-            pusher_piece = self.get_piece_by_id(pusher_piece_id)
-            assert pusher_piece is not None
+            pusher_pos = self._position_by_piece_id[pusher_piece_id]
             push_dir = remaining_moves_by_piece_id[pusher_piece_id]
-            target_pos = pusher_piece.position.offset_in_direction(
-                push_dir, steps=len(push_chain)
-            )
+            target_pos = pusher_pos.offset_in_direction(push_dir, steps=len(push_chain))
             try:
                 target_pos_to_pushers[target_pos].append(pusher_piece_id)
             except KeyError:
@@ -261,14 +342,14 @@ class Board:
 
             # multiple pieces trying to occupy the same empty spot
             for piece_id in pushers:
-                del remaining_moves_by_piece_id[piece_id]
+                push_chains.remove(piece_id)
                 del complete_push_chains[piece_id]
             event.actions.extend(action_by_piece_id[piece_id] for piece_id in pushers)
             event.outcomes.append(
                 MoveConflictOutcome.build(
                     MoveConflictOutcomePayload(
                         piece_ids=pushers,
-                        collision_point=target_pos,
+                        collision_point=target_pos.to_position(),
                     )
                 )
             )
@@ -284,9 +365,9 @@ class Board:
             )
             push_outcomes.append(push_outcome)
             event.outcomes.append(PushOutcome.build(push_outcome))
-            del remaining_moves_by_piece_id[pusher_piece_id]
+            push_chains.remove(pusher_piece_id)
 
-        self._execute_push_outcomes(push_outcomes)
+        push_chains.mark_positions_changed(self._execute_push_outcomes(push_outcomes))
 
         return event
 
@@ -295,20 +376,19 @@ class Board:
     ) -> list[TimelineEventAction]:
         event_actions: list[TimelineEventAction] = []
         for move in planned_moves:
-            piece = self.get_piece_by_id(move.piece_id)
-            if piece is None:
+            pos = self._position_by_piece_id.get(move.piece_id)
+            if pos is None:
                 raise IllegalPlayerMoveError(
                     piece_id=move.piece_id, message="piece not found"
                 )
-
-            if piece.player_id != player_id:
+            if self._piece_by_position[pos].player_id != player_id:
                 raise IllegalPlayerMoveError(
                     piece_id=move.piece_id, message="piece not owned by this player"
                 )
 
             event_actions.append(
                 TimelineEventAction(
-                    player_id=piece.player_id,
+                    player_id=player_id,
                     piece_id=move.piece_id,
                     action=move.action,
                 )
@@ -331,11 +411,29 @@ class Board:
                 continue
             remaining_moves_by_piece_id[move.piece_id] = move_dir
 
+        if (
+            board_vectorized is not None
+            and isinstance(self._piece_by_position, DensePieceStorage)
+            and len(remaining_moves_by_piece_id) >= VECTORIZED_MIN_MOVES
+        ):
+            resolver = board_vectorized.VectorizedMoveResolver(
+                self._piece_by_position,
+                self._position_by_piece_id,
+                self._execute_push_outcomes,
+                remaining_moves_by_piece_id,
+            )
+            return resolver.perform_player_moves(action_by_piece_id)
+
+        push_chains = PushChainCache(
+            self._piece_by_position,
+            self._position_by_piece_id,
+            remaining_moves_by_piece_id,
+        )
         events: list[TimelineEvent] = []
         while remaining_moves_by_piece_id:
             try:
                 event = self._perform_player_move_event(
-                    action_by_piece_id, remaining_moves_by_piece_id
+                    action_by_piece_id, remaining_moves_by_piece_id, push_chains
                 )
             except PlayerMovesExhaustedError:
                 break
@@ -375,7 +473,8 @@ class Board:
         return events
 
     def _get_remaining_player_ids(self) -> set[uuid.UUID]:
-        return {piece.player_id for piece in self._piece_by_position.values()}
+        # players without any pieces are dropped from the index
+        return set(self._piece_count_by_player)
 
     def get_game_over_model(self) -> GameOver | None:
         player_ids = self._get_remaining_player_ids()
@@ -388,10 +487,9 @@ class Board:
             case _:
                 return None
 
-    def _create_new_piece(self, player_id: uuid.UUID, pos: Position) -> None:
-        assert pos not in self._piece_by_position
-        self._piece_by_position[pos] = PieceInformation(
-            player_id=player_id, piece_id=uuid.uuid4()
+    def _create_new_piece(self, player_id: uuid.UUID, pos: Coord) -> None:
+        self._place_piece(
+            pos, PieceInformation(player_id=player_id, piece_id=uuid.uuid4())
         )
 
     def place_pieces(
@@ -407,12 +505,9 @@ class Board:
                 pieces_per_player = 1
 
         # we now know for sure that len(player_ids) * pieces_per_player can fit on the board
-        exclude_pos: set[Position] = set()
+        positions = iter(
+            self._platform.sample_positions(rng, len(player_ids) * pieces_per_player)
+        )
         for player_id in player_ids:
-            for _ in range(pieces_per_player):
-                pos = self._platform.get_random_position_on_board(
-                    rng, exclude=exclude_pos
-                )
-                assert pos
-                exclude_pos.add(pos)
+            for pos in itertools.islice(positions, pieces_per_player):
                 self._create_new_piece(player_id, pos)
@@ -0,0 +1,117 @@
+import asyncio
+import enum
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from random import Random
+from typing import Callable, TypeVar, TypeVarTuple
+
+from ..models import BoardPlatform as BoardPlatformModel
+from ..models import TimelineEvent, TimelineEventAction
+from .board import Board, PackedPieces
+from .board_platform import BoardPlatformABC, ClientDefinedPlatform
+
+_ArgsT = TypeVarTuple("_ArgsT")
+_ReturnT = TypeVar("_ReturnT")
+
+
+class BoardExecutionMode(str, enum.Enum):
+    # run on the event loop
+    INLINE = "inline"
+    THREAD = "thread"
+    # the board is shipped to the worker process and back as `PackedPieces`
+    PROCESS = "process"
+
+
+def _setup_board(
+    platform_model: BoardPlatformModel,
+    player_ids: list[uuid.UUID],
+    pieces_per_player: int,
+) -> Board:
+    board = Board(platform=ClientDefinedPlatform(platform_model))
+    board.place_pieces(Random(), player_ids, pieces_per_player)
+    return board
+
+
+def _setup_packed_board(
+    platform_model: BoardPlatformModel,
+    player_ids: list[uuid.UUID],
+    pieces_per_player: int,
+) -> tuple[BoardPlatformABC, PackedPieces]:
+    board = _setup_board(platform_model, player_ids, pieces_per_player)
+    return board.platform, board.pack_pieces()
+
+
+def _perform_packed_player_moves(
+    platform: BoardPlatformABC,
+    packed: PackedPieces,
+    validated_moves_by_player: dict[uuid.UUID, list[TimelineEventAction]],
+) -> tuple[PackedPieces, list[TimelineEvent]]:
+    board = Board.from_packed_pieces(packed, platform=platform)
+    timeline = board.perform_all_player_moves(validated_moves_by_player)
+    return board.pack_pieces(), timeline
+
+
+class BoardExecutor:
+    """Runs the CPU heavy parts of a game without blocking the event loop."""
+
+    _mode: BoardExecutionMode
+    _pool: Executor | None
+
+    def __init__(self, mode: BoardExecutionMode) -> None:
+        self._mode = mode
+        match mode:
+            case BoardExecutionMode.INLINE:
+                self._pool = None
+            case BoardExecutionMode.THREAD:
+                self._pool = ThreadPoolExecutor(thread_name_prefix="board")
+            case BoardExecutionMode.PROCESS:
+                self._pool = ProcessPoolExecutor()
+
+    async def _run(
+        self, func: Callable[[*_ArgsT], _ReturnT], *args: *_ArgsT
+    ) -> _ReturnT:
+        if self._pool is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def setup_board(
+        self,
+        platform_model: BoardPlatformModel,
+        player_ids: list[uuid.UUID],
+        pieces_per_player: int,
+    ) -> Board:
+        if self._mode != BoardExecutionMode.PROCESS:
+            return await self._run(
+                _setup_board, platform_model, player_ids, pieces_per_player
+            )
+
+        platform, packed = await self._run(
+            _setup_packed_board, platform_model, player_ids, pieces_per_player
+        )
+        return Board.from_packed_pieces(packed, platform=platform)
+
+    async def perform_all_player_moves(
+        self,
+        board: Board,
+        validated_moves_by_player: dict[uuid.UUID, list[TimelineEventAction]],
+    ) -> tuple[Board, list[TimelineEvent]]:
+        """Returns the board after the moves were performed, which isn't necessarily the same object."""
+        if self._mode != BoardExecutionMode.PROCESS:
+            timeline = await self._run(
+                board.perform_all_player_moves, validated_moves_by_player
+            )
+            return board, timeline
+
+        packed, timeline = await self._run(
+            _perform_packed_player_moves,
+            board.platform,
+            board.pack_pieces(),
+            validated_moves_by_player,
+        )
+        return Board.from_packed_pieces(packed, platform=board.platform), timeline
+
+
+@lru_cache()
+def get_board_executor(mode: BoardExecutionMode) -> BoardExecutor:
+    return BoardExecutor(mode)
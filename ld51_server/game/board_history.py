@@ -0,0 +1,60 @@
+import uuid
+
+from ..models import PlayerPiecePosition
+
+
+class BoardStateHistory:
+    """The last few versions of the board state.
+
+    Clients that acknowledged a version only need the changes since that version.
+    """
+
+    _max_versions: int
+    _version: int
+    _pieces: list[PlayerPiecePosition]
+    _piece_by_id_by_version: dict[int, dict[uuid.UUID, PlayerPiecePosition]]
+
+    def __init__(self, pieces: list[PlayerPiecePosition], *, max_versions: int) -> None:
+        assert max_versions > 0
+        self._max_versions = max_versions
+        self._version = 0
+        self._piece_by_id_by_version = {}
+        self.push(pieces)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def pieces(self) -> list[PlayerPiecePosition]:
+        """All pieces of the current version."""
+        return self._pieces
+
+    def push(self, pieces: list[PlayerPiecePosition]) -> int:
+        """Add the next version and return its number."""
+        self._version += 1
+        self._pieces = pieces
+        self._piece_by_id_by_version[self._version] = {
+            piece.piece_id: piece for piece in pieces
+        }
+        self._piece_by_id_by_version.pop(self._version - self._max_versions, None)
+        return self._version
+
+    def diff(
+        self, base_version: int
+    ) -> tuple[list[PlayerPiecePosition], list[uuid.UUID]] | None:
+        """Pieces that changed and ids of the pieces that were removed since `base_version`.
+
+        `None` if the version is unknown or was already dropped.
+        """
+        try:
+            base = self._piece_by_id_by_version[base_version]
+        except KeyError:
+            return None
+
+        current = self._piece_by_id_by_version[self._version]
+        changed = [
+            piece for piece_id, piece in current.items() if base.get(piece_id) != piece
+        ]
+        removed = [piece_id for piece_id in base if piece_id not in current]
+        return changed, removed
@@ -1,34 +1,65 @@
 import abc
 import dataclasses
+import functools
+from array import array
 from random import Random
-from typing import Iterator
 
 from ..models import BoardPlatform as BoardPlatformModel
-from ..models import BoardPlatformTile, Position
+from ..models import BoardPlatformTile, BoardPlatformTileType, Position
+from ..protocol.codec import CodecABC, Frame
+from .coord import Coord
+
+# value of cells without a tile in `ClientDefinedPlatform`
+_NO_TILE = 0
 
 
 class BoardPlatformABC(abc.ABC):
     @abc.abstractmethod
-    def is_position_on_board(self, pos: Position) -> bool:
+    def is_position_on_board(self, pos: Coord) -> bool:
         ...
 
     @abc.abstractmethod
     def to_model(self) -> BoardPlatformModel:
         ...
 
+    @functools.cached_property
+    def _encoded_model_by_codec(self) -> dict[CodecABC, Frame]:
+        return {}
+
+    def encode_model(self, codec: CodecABC) -> Frame:
+        """`to_model()` encoded with the codec, platforms don't change so this is only done once per codec."""
+        try:
+            return self._encoded_model_by_codec[codec]
+        except KeyError:
+            encoded = self._encoded_model_by_codec[codec] = codec.encode_model(
+                self.to_model()
+            )
+            return encoded
+
+    def __getstate__(self) -> dict[str, object]:
+        # no need to ship the encoded models to worker processes
+        state = self.__dict__.copy()
+        state.pop("_encoded_model_by_codec", None)
+        return state
+
     @abc.abstractmethod
     def on_board_positions(self) -> int | None:
         """Number of available positions or `None` if unlimited."""
 
     @abc.abstractmethod
-    def get_random_position_on_board(
-        self, rng: Random, *, exclude: set[Position] | None = None
-    ) -> Position | None:
-        ...
+    def get_bounds(self) -> tuple[Coord, Coord] | None:
+        """Inclusive top left and bottom right corners of all on-board positions or `None` if unbounded."""
+
+    @abc.abstractmethod
+    def sample_positions(self, rng: Random, k: int) -> list[Coord]:
+        """Draw `k` distinct random on-board positions.
+
+        Raises `ValueError` if there aren't enough positions.
+        """
 
 
 class InfiniteBoardPlatform(BoardPlatformABC):
-    def is_position_on_board(self, pos: Position) -> bool:
+    def is_position_on_board(self, pos: Coord) -> bool:
         return True
 
     def to_model(self) -> BoardPlatformModel:
@@ -37,19 +68,19 @@ class InfiniteBoardPlatform(BoardPlatformABC):
     def on_board_positions(self) -> None:
         return None
 
-    def get_random_position_on_board(
-        self, rng: Random, *, exclude: set[Position] | None = None
-    ) -> Position:
+    def get_bounds(self) -> None:
+        return None
+
+    def sample_positions(self, rng: Random, k: int) -> list[Coord]:
         _bits = 16
 
         center = rng.getrandbits(_bits)
-        while True:
+        positions: dict[Coord, None] = {}
+        while len(positions) < k:
             x = rng.getrandbits(_bits) - center
             y = rng.getrandbits(_bits) - center
-            pos = Position(x=x, y=y)
-            if exclude and pos in exclude:
-                continue
-            return pos
+            positions[Coord(x, y)] = None
+        return list(positions)
 
 
 @dataclasses.dataclass()
@@ -73,7 +104,7 @@ class RectangleBoardPlatform(BoardPlatformABC):
     def max_y(self) -> int:
         return self.bottom_right.y
 
-    def is_position_on_board(self, pos: Position) -> bool:
+    def is_position_on_board(self, pos: Coord) -> bool:
         return self.min_x <= pos.x <= self.max_x and self.min_y <= pos.y <= self.max_y
 
     def to_model(self) -> BoardPlatformModel:
@@ -84,50 +115,133 @@ class RectangleBoardPlatform(BoardPlatformABC):
         height = self.max_y - self.min_y + 1
         return width * height
 
-    def _iter_positions(self) -> Iterator[Position]:
-        for x in range(self.min_x, self.max_x + 1):
-            for y in range(self.min_y, self.max_y + 1):
-                yield Position(x=x, y=y)
-
-    def get_random_position_on_board(
-        self, rng: Random, *, exclude: set[Position] | None = None
-    ) -> Position | None:
-        if not exclude:
-            x = rng.randint(self.min_x, self.max_x)
-            y = rng.randint(self.min_y, self.max_y)
-            return Position(x=x, y=y)
+    def get_bounds(self) -> tuple[Coord, Coord]:
+        return Coord.from_position(self.top_left), Coord.from_position(
+            self.bottom_right
+        )
 
-        choices = tuple(pos for pos in self._iter_positions() if pos not in exclude)
-        if not choices:
-            return None
-        return rng.choice(choices)
+    def sample_positions(self, rng: Random, k: int) -> list[Coord]:
+        width = self.max_x - self.min_x + 1
+        # `range` doesn't materialize the positions, so this only costs O(k)
+        return [
+            Coord(self.min_x + idx % width, self.min_y + idx // width)
+            for idx in rng.sample(range(self.on_board_positions()), k)
+        ]
 
 
 class ClientDefinedPlatform(BoardPlatformABC):
-    _tile_by_pos: dict[Position, BoardPlatformTile]
-    _on_board_positions: set[Position]
+    """Platform made of the tiles sent by a client.
+
+    The tiles are kept in a grid spanning their bounding box. Every cell holds the index of
+    the tile's texture and type in `_palette` plus one, or `_NO_TILE`.
+    """
+
+    # bounding box of all tiles
+    _min_x: int
+    _min_y: int
+    _width: int
+    _height: int
+    _palette: list[tuple[str, BoardPlatformTileType]]
+    _tile_cells: "array[int]"
+    # one bit per cell, set if the cell is on the board
+    _on_board_bits: bytearray
+    # all on-board cells in ascending order, for sampling
+    _on_board_cells: "array[int]"
+    # bounding box of the on-board cells
+    _bounds: tuple[Coord, Coord] | None
 
     def __init__(self, model: BoardPlatformModel) -> None:
-        self._tile_by_pos = {tile.position: tile for tile in model.tiles}
-        self._on_board_positions = {
-            tile.position for tile in model.tiles if not tile.tile_type.is_off_board()  # type: ignore
-        }
-
-    def is_position_on_board(self, pos: Position) -> bool:
-        return pos in self._on_board_positions
+        tiles = model.tiles
+        if tiles:
+            self._min_x = min(tile.position.x for tile in tiles)
+            self._min_y = min(tile.position.y for tile in tiles)
+            self._width = max(tile.position.x for tile in tiles) - self._min_x + 1
+            self._height = max(tile.position.y for tile in tiles) - self._min_y + 1
+        else:
+            self._min_x = self._min_y = self._width = self._height = 0
+
+        self._palette = []
+        palette_idx_by_entry: dict[tuple[str, BoardPlatformTileType], int] = {}
+        tile_cells = array("I", [_NO_TILE]) * (self._width * self._height)
+        for tile in tiles:
+            entry = (tile.texture_id, tile.tile_type)
+            try:
+                palette_idx = palette_idx_by_entry[entry]
+            except KeyError:
+                palette_idx = palette_idx_by_entry[entry] = len(self._palette)
+                self._palette.append(entry)
+            tile_cells[self._cell_index(tile.position.x, tile.position.y)] = (
+                palette_idx + 1
+            )
+
+        # most platforms only use a handful of textures
+        if len(self._palette) < 0xFFFF:
+            tile_cells = array("H", tile_cells)
+        self._tile_cells = tile_cells
+        self._build_on_board_cells()
+
+    def _cell_index(self, x: int, y: int) -> int:
+        return (y - self._min_y) * self._width + x - self._min_x
+
+    def _cell_position(self, cell: int) -> Coord:
+        y, x = divmod(cell, self._width)
+        return Coord(x + self._min_x, y + self._min_y)
+
+    def _build_on_board_cells(self) -> None:
+        on_board_palette = [
+            not tile_type.is_off_board() for _, tile_type in self._palette
+        ]
+        self._on_board_bits = bytearray((len(self._tile_cells) + 7) // 8)
+        self._on_board_cells = array("I")
+        for cell, palette_value in enumerate(self._tile_cells):
+            if palette_value != _NO_TILE and on_board_palette[palette_value - 1]:
+                self._on_board_bits[cell >> 3] |= 1 << (cell & 7)
+                self._on_board_cells.append(cell)
+
+        if not self._on_board_cells:
+            self._bounds = None
+            return
+
+        # cells are in row-major order, so the first and last one are in the top and bottom row
+        min_y = self._cell_position(self._on_board_cells[0]).y
+        max_y = self._cell_position(self._on_board_cells[-1]).y
+        columns = {cell % self._width for cell in self._on_board_cells}
+        self._bounds = (
+            Coord(min(columns) + self._min_x, min_y),
+            Coord(max(columns) + self._min_x, max_y),
+        )
+
+    def is_position_on_board(self, pos: Coord) -> bool:
+        x = pos.x - self._min_x
+        y = pos.y - self._min_y
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return False
+        cell = y * self._width + x
+        return bool(self._on_board_bits[cell >> 3] >> (cell & 7) & 1)
 
     def to_model(self) -> BoardPlatformModel:
-        return BoardPlatformModel(tiles=list(self._tile_by_pos.values()))
+        """The tiles are listed row by row."""
+        tiles: list[BoardPlatformTile] = []
+        for cell, palette_value in enumerate(self._tile_cells):
+            if palette_value == _NO_TILE:
+                continue
+            texture_id, tile_type = self._palette[palette_value - 1]
+            tiles.append(
+                BoardPlatformTile(
+                    position=self._cell_position(cell).to_position(),
+                    texture_id=texture_id,
+                    tile_type=tile_type,
+                )
+            )
+        return BoardPlatformModel(tiles=tiles)
 
     def on_board_positions(self) -> int:
-        return len(self._on_board_positions)
-
-    def get_random_position_on_board(
-        self, rng: Random, *, exclude: set[Position] | None = None
-    ) -> Position | None:
-        if exclude is None:
-            exclude = set()
-        choices = tuple(pos for pos in self._on_board_positions if pos not in exclude)
-        if not choices:
-            return None
-        return rng.choice(choices)
+        return len(self._on_board_cells)
+
+    def get_bounds(self) -> tuple[Coord, Coord] | None:
+        return self._bounds
+
+    def sample_positions(self, rng: Random, k: int) -> list[Coord]:
+        return [
+            self._cell_position(cell) for cell in rng.sample(self._on_board_cells, k)
+        ]
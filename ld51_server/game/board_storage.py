@@ -0,0 +1,309 @@
+import abc
+import dataclasses
+import enum
+import uuid
+from array import array
+from typing import Iterator, MutableMapping
+
+from ..models import Direction, PlayerPiecePosition
+from .coord import DELTA_BY_DIRECTION, Coord
+from .layered_dict import LayeredDict
+
+# cells in the dense grid hold a slot in the piece table or this value
+_EMPTY_CELL = -1
+# dense storage costs 4 bytes per cell, don't go beyond 64 MiB for a single board
+MAX_DENSE_CELLS = 1 << 24
+
+
+@dataclasses.dataclass(kw_only=True)
+class PieceInformation:
+    player_id: uuid.UUID
+    piece_id: uuid.UUID
+
+    @classmethod
+    def from_player_piece_position(cls, piece: PlayerPiecePosition):
+        return cls(player_id=piece.player_id, piece_id=piece.piece_id)
+
+
+class BoardStorageMode(str, enum.Enum):
+    AUTO = "auto"
+    SPARSE = "sparse"
+    DENSE = "dense"
+
+
+class PieceStorageABC(abc.ABC):
+    """Maps positions on the board to the piece occupying them."""
+
+    @abc.abstractmethod
+    def get(self, pos: Coord) -> PieceInformation | None:
+        ...
+
+    @abc.abstractmethod
+    def __contains__(self, pos: Coord) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def __setitem__(self, pos: Coord, piece: PieceInformation) -> None:
+        ...
+
+    @abc.abstractmethod
+    def pop(self, pos: Coord) -> PieceInformation:
+        """Raises `KeyError` if there's no piece at the given position."""
+
+    @abc.abstractmethod
+    def items(self) -> Iterator[tuple[Coord, PieceInformation]]:
+        ...
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def walk_chain(
+        self, pos: Coord, direction: Direction, *, max_len: int | None = None
+    ) -> list[PieceInformation] | None:
+        """Collect the pieces directly following `pos` in the given direction.
+
+        The walk stops at the first empty position. Returns `None` if the chain is longer than `max_len`.
+        """
+
+    def __getitem__(self, pos: Coord) -> PieceInformation:
+        piece = self.get(pos)
+        if piece is None:
+            raise KeyError(pos)
+        return piece
+
+
+class SparsePieceStorage(PieceStorageABC):
+    _piece_by_position: MutableMapping[Coord, PieceInformation]
+
+    def __init__(
+        self, piece_by_position: MutableMapping[Coord, PieceInformation] | None = None
+    ) -> None:
+        self._piece_by_position = {} if piece_by_position is None else piece_by_position
+
+    def get(self, pos: Coord) -> PieceInformation | None:
+        return self._piece_by_position.get(pos)
+
+    def __contains__(self, pos: Coord) -> bool:
+        return pos in self._piece_by_position
+
+    def __setitem__(self, pos: Coord, piece: PieceInformation) -> None:
+        self._piece_by_position[pos] = piece
+
+    def pop(self, pos: Coord) -> PieceInformation:
+        return self._piece_by_position.pop(pos)
+
+    def items(self) -> Iterator[tuple[Coord, PieceInformation]]:
+        return iter(self._piece_by_position.items())
+
+    def fork(self) -> tuple["SparsePieceStorage", "SparsePieceStorage"]:
+        parent, child = LayeredDict.fork(self._piece_by_position)
+        return SparsePieceStorage(parent), SparsePieceStorage(child)
+
+    def __len__(self) -> int:
+        return len(self._piece_by_position)
+
+    def walk_chain(
+        self, pos: Coord, direction: Direction, *, max_len: int | None = None
+    ) -> list[PieceInformation] | None:
+        dx, dy = DELTA_BY_DIRECTION[direction]
+        x, y = pos
+        chain: list[PieceInformation] = []
+        while True:
+            x += dx
+            y += dy
+            piece = self._piece_by_position.get(Coord(x, y))
+            if piece is None:
+                return chain
+            if max_len is not None and len(chain) >= max_len:
+                return None
+            chain.append(piece)
+
+
+class DensePieceStorage(PieceStorageABC):
+    """Flat array of piece slots spanning the bounding box of the platform.
+
+    Every cell holds the slot of the piece in `_pieces` or `_EMPTY_CELL`.
+    """
+
+    _min_x: int
+    _min_y: int
+    _width: int
+    _height: int
+    _cells: "array[int]"
+    _pieces: list[PieceInformation | None]
+    _cell_by_slot: list[int]
+    _free_slots: list[int]
+
+    def __init__(self, top_left: Coord, bottom_right: Coord) -> None:
+        self._min_x = top_left.x
+        self._min_y = top_left.y
+        self._width = bottom_right.x - top_left.x + 1
+        self._height = bottom_right.y - top_left.y + 1
+        if self._width <= 0 or self._height <= 0:
+            raise ValueError("bounding box must not be empty")
+        self._cells = array("i", [_EMPTY_CELL]) * (self._width * self._height)
+        self._pieces = []
+        self._cell_by_slot = []
+        self._free_slots = []
+
+    @property
+    def origin(self) -> tuple[int, int]:
+        return self._min_x, self._min_y
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Width and height of the grid."""
+        return self._width, self._height
+
+    @property
+    def cells(self) -> "array[int]":
+        """Row-major grid of piece slots. Must not be modified directly."""
+        return self._cells
+
+    def get_piece_in_slot(self, slot: int) -> PieceInformation:
+        piece = self._pieces[slot]
+        assert piece is not None
+        return piece
+
+    @classmethod
+    def fits(cls, top_left: Coord, bottom_right: Coord) -> bool:
+        width = bottom_right.x - top_left.x + 1
+        height = bottom_right.y - top_left.y + 1
+        return 0 < width * height <= MAX_DENSE_CELLS
+
+    def _cell_index(self, pos: Coord) -> int:
+        """Index of the cell or `_EMPTY_CELL` if the position lies outside of the bounding box."""
+        x = pos.x - self._min_x
+        y = pos.y - self._min_y
+        if 0 <= x < self._width and 0 <= y < self._height:
+            return y * self._width + x
+        return _EMPTY_CELL
+
+    def _cell_position(self, cell: int) -> Coord:
+        y, x = divmod(cell, self._width)
+        return Coord(x=x + self._min_x, y=y + self._min_y)
+
+    def get(self, pos: Coord) -> PieceInformation | None:
+        cell = self._cell_index(pos)
+        if cell == _EMPTY_CELL:
+            return None
+        slot = self._cells[cell]
+        if slot == _EMPTY_CELL:
+            return None
+        return self._pieces[slot]
+
+    def __contains__(self, pos: Coord) -> bool:
+        cell = self._cell_index(pos)
+        return cell != _EMPTY_CELL and self._cells[cell] != _EMPTY_CELL
+
+    def __setitem__(self, pos: Coord, piece: PieceInformation) -> None:
+        cell = self._cell_index(pos)
+        if cell == _EMPTY_CELL:
+            raise ValueError(f"position {pos} is outside of the board")
+
+        slot = self._cells[cell]
+        if slot != _EMPTY_CELL:
+            self._pieces[slot] = piece
+            return
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._pieces[slot] = piece
+            self._cell_by_slot[slot] = cell
+        else:
+            slot = len(self._pieces)
+            self._pieces.append(piece)
+            self._cell_by_slot.append(cell)
+        self._cells[cell] = slot
+
+    def pop(self, pos: Coord) -> PieceInformation:
+        cell = self._cell_index(pos)
+        slot = _EMPTY_CELL if cell == _EMPTY_CELL else self._cells[cell]
+        if slot == _EMPTY_CELL:
+            raise KeyError(pos)
+
+        piece = self._pieces[slot]
+        assert piece is not None
+        self._cells[cell] = _EMPTY_CELL
+        self._pieces[slot] = None
+        self._free_slots.append(slot)
+        return piece
+
+    def items(self) -> Iterator[tuple[Coord, PieceInformation]]:
+        for slot, piece in enumerate(self._pieces):
+            if piece is not None:
+                yield self._cell_position(self._cell_by_slot[slot]), piece
+
+    def __len__(self) -> int:
+        return len(self._pieces) - len(self._free_slots)
+
+    def walk_chain(
+        self, pos: Coord, direction: Direction, *, max_len: int | None = None
+    ) -> list[PieceInformation] | None:
+        cell = self._cell_index(pos)
+        if cell == _EMPTY_CELL:
+            return []
+
+        dx, dy = DELTA_BY_DIRECTION[direction]
+        stride = dy * self._width + dx
+        # number of cells until we fall off the bounding box
+        x = pos.x - self._min_x
+        y = pos.y - self._min_y
+        match direction:
+            case Direction.UP:
+                steps = y
+            case Direction.DOWN:
+                steps = self._height - 1 - y
+            case Direction.LEFT:
+                steps = x
+            case Direction.RIGHT:
+                steps = self._width - 1 - x
+            case _:
+                raise NotImplementedError
+
+        cells = self._cells
+        pieces = self._pieces
+        chain: list[PieceInformation] = []
+        for _ in range(steps):
+            cell += stride
+            slot = cells[cell]
+            if slot == _EMPTY_CELL:
+                break
+            if max_len is not None and len(chain) >= max_len:
+                return None
+            piece = pieces[slot]
+            assert piece is not None
+            chain.append(piece)
+        return chain
+
+
+def fork_piece_storage(
+    storage: PieceStorageABC,
+) -> tuple[PieceStorageABC, PieceStorageABC]:
+    """Split the storage into two independent copies sharing all pieces stored so far.
+
+    The storage itself must not be modified afterwards, use the returned copies instead.
+    Both copies only record their own changes, dense storage is used as the read-only base of sparse copies.
+    """
+    if isinstance(storage, SparsePieceStorage):
+        return storage.fork()
+    parent, child = LayeredDict.fork(storage)
+    return SparsePieceStorage(parent), SparsePieceStorage(child)
+
+
+def create_piece_storage(
+    mode: BoardStorageMode, bounds: tuple[Coord, Coord] | None
+) -> PieceStorageABC:
+    match mode:
+        case BoardStorageMode.SPARSE:
+            return SparsePieceStorage()
+        case BoardStorageMode.DENSE:
+            if bounds is None:
+                raise ValueError("dense storage requires a bounded platform")
+            return DensePieceStorage(*bounds)
+        case BoardStorageMode.AUTO:
+            if bounds is not None and DensePieceStorage.fits(*bounds):
+                return DensePieceStorage(*bounds)
+            return SparsePieceStorage()
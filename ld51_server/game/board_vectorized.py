@@ -0,0 +1,328 @@
+"""NumPy implementation of the move resolution for boards backed by `DensePieceStorage`.
+
+All pushers are ray-marched over the occupancy grid at once. Only chains that
+actually interact with other chains are inspected one by one, everything else stays
+vectorized. The resulting events are identical to the ones produced by `Board`.
+"""
+
+import uuid
+from typing import Any, Callable, Mapping
+
+import numpy as np
+import numpy.typing as npt
+
+from ..models import (
+    Direction,
+    MoveConflictOutcome,
+    MoveConflictOutcomePayload,
+    Position,
+    PushConflictOutcome,
+    PushConflictOutcomePayload,
+    PushOutcome,
+    PushOutcomePayload,
+    TimelineEvent,
+    TimelineEventAction,
+)
+from .board_storage import DensePieceStorage
+from .coord import DELTA_BY_DIRECTION, Coord
+
+_IntArray = npt.NDArray[np.int64]
+_BoolArray = npt.NDArray[np.bool_]
+
+ExecutePushOutcomes = Callable[[list[PushOutcomePayload]], object]
+
+
+class VectorizedMoveResolver:
+    _storage: DensePieceStorage
+    _position_by_piece_id: Mapping[uuid.UUID, Coord]
+    _execute_push_outcomes: ExecutePushOutcomes
+
+    _origin_x: int
+    _origin_y: int
+    _width: int
+    _height: int
+    _grid: npt.NDArray[np.signedinteger[Any]]
+
+    # state of every pusher, in the order of the remaining moves
+    _pusher_ids: list[uuid.UUID]
+    _pusher_idx_by_id: dict[uuid.UUID, int]
+    _directions: list[Direction]
+    _x: _IntArray
+    _y: _IntArray
+    _dx: _IntArray
+    _dy: _IntArray
+    _remaining: _BoolArray
+
+    def __init__(
+        self,
+        storage: DensePieceStorage,
+        position_by_piece_id: Mapping[uuid.UUID, Coord],
+        execute_push_outcomes: ExecutePushOutcomes,
+        remaining_moves_by_piece_id: dict[uuid.UUID, Direction],
+    ) -> None:
+        self._storage = storage
+        self._position_by_piece_id = position_by_piece_id
+        self._execute_push_outcomes = execute_push_outcomes
+
+        self._origin_x, self._origin_y = storage.origin
+        self._width, self._height = storage.shape
+        cells = storage.cells
+        # zero-copy view, changes to the storage are immediately visible
+        self._grid = np.frombuffer(cells, dtype=np.dtype(f"i{cells.itemsize}"))
+
+        self._pusher_ids = list(remaining_moves_by_piece_id.keys())
+        self._pusher_idx_by_id = {
+            piece_id: idx for idx, piece_id in enumerate(self._pusher_ids)
+        }
+        self._directions = list(remaining_moves_by_piece_id.values())
+        pusher_count = len(self._pusher_ids)
+        self._x = np.zeros(pusher_count, dtype=np.int64)
+        self._y = np.zeros(pusher_count, dtype=np.int64)
+        self._remaining = np.ones(pusher_count, dtype=np.bool_)
+        self._refresh_pusher_positions(self._pusher_ids)
+
+        deltas = np.array(
+            [DELTA_BY_DIRECTION[direction] for direction in self._directions],
+            dtype=np.int64,
+        ).reshape(pusher_count, 2)
+        self._dx = deltas[:, 0]
+        self._dy = deltas[:, 1]
+
+    def _refresh_pusher_positions(self, piece_ids: list[uuid.UUID]) -> None:
+        for piece_id in piece_ids:
+            try:
+                idx = self._pusher_idx_by_id[piece_id]
+            except KeyError:
+                continue
+            pos = self._position_by_piece_id.get(piece_id)
+            if pos is None:
+                # this piece no longer exists
+                self._remaining[idx] = False
+                continue
+            self._x[idx] = pos.x - self._origin_x
+            self._y[idx] = pos.y - self._origin_y
+
+    def _march_chains(self) -> tuple[_IntArray, int] | None:
+        """Find the pushers with the shortest chains.
+
+        Returns the pusher indices (in order) and the number of victims in their chains.
+        """
+        active = np.flatnonzero(self._remaining)
+        if active.size == 0:
+            return None
+
+        steps = 0
+        while True:
+            steps += 1
+            x = self._x[active] + self._dx[active] * steps
+            y = self._y[active] + self._dy[active] * steps
+            in_bounds = (x >= 0) & (x < self._width) & (y >= 0) & (y < self._height)
+            occupied = np.zeros(active.size, dtype=np.bool_)
+            occupied[in_bounds] = (
+                self._grid[y[in_bounds] * self._width + x[in_bounds]] != -1
+            )
+            if not occupied.all():
+                return active[~occupied], steps - 1
+            active = active[occupied]
+
+    def _find_push_conflicts(
+        self, pushers: _IntArray, victim_cells: _IntArray, victim_chain_length: int
+    ) -> tuple[list[PushConflictOutcomePayload], _IntArray]:
+        """Vectorized version of `Board._find_push_conflicts`.
+
+        Returns the conflicts and the number of victims left in every chain after
+        cutting them off at other pushers.
+        """
+        kept = np.full(pushers.size, victim_chain_length, dtype=np.int64)
+        if victim_chain_length == 0:
+            return [], kept
+
+        pusher_cells = self._y[pushers] * self._width + self._x[pushers]
+        is_pusher = np.isin(victim_cells, pusher_cells)
+        truncated = is_pusher.any(axis=1)
+        kept[truncated] = is_pusher[truncated].argmax(axis=1)
+        in_chain = np.arange(victim_chain_length)[None, :] < kept[:, None]
+
+        # victims that are part of more than one chain
+        unique_cells, counts = np.unique(victim_cells[in_chain], return_counts=True)
+        shared = in_chain & np.isin(victim_cells, unique_cells[counts >= 2])
+
+        # which pusher every truncated chain ran into
+        pusher_order = np.argsort(pusher_cells)
+        hit_pusher = np.zeros(pushers.size, dtype=np.int64)
+        hit_cells = victim_cells[np.flatnonzero(truncated), kept[truncated]]
+        hit_pusher[truncated] = pusher_order[
+            np.searchsorted(pusher_cells[pusher_order], hit_cells)
+        ]
+
+        global_min_distance: int | None = None
+
+        def update_global_min_distance(other: int) -> None:
+            nonlocal global_min_distance
+            if global_min_distance is None or other < global_min_distance:
+                global_min_distance = other
+
+        # only the interesting chains are inspected one by one, in order
+        head_on_collisions: dict[frozenset[uuid.UUID], int] = {}
+        victim_to_pushers: dict[int, tuple[int, list[uuid.UUID]]] = {}
+        for row in np.flatnonzero(truncated | shared.any(axis=1)).tolist():
+            pusher_idx = int(pushers[row])
+            pusher_piece_id = self._pusher_ids[pusher_idx]
+            for col in np.flatnonzero(shared[row]).tolist():
+                chain_idx = col + 1
+                cell = int(victim_cells[row, col])
+                try:
+                    min_distance, pusher_ids = victim_to_pushers[cell]
+                except KeyError:
+                    min_distance = None
+                    pusher_ids = []
+
+                if min_distance is None or chain_idx < min_distance:
+                    min_distance = chain_idx
+                    pusher_ids = [pusher_piece_id]
+                elif chain_idx == min_distance:
+                    pusher_ids.append(pusher_piece_id)
+
+                victim_to_pushers[cell] = (min_distance, pusher_ids)
+                if len(pusher_ids) >= 2:
+                    update_global_min_distance(min_distance)
+
+            if not truncated[row]:
+                continue
+            other_idx = int(pushers[hit_pusher[row]])
+            collision_key = frozenset((pusher_piece_id, self._pusher_ids[other_idx]))
+            if collision_key in head_on_collisions:
+                continue
+            other_dir = self._directions[other_idx]
+            if self._directions[pusher_idx] != other_dir.get_opposite():
+                continue
+            min_distance = victim_chain_length // 2
+            head_on_collisions[collision_key] = min_distance
+            update_global_min_distance(min_distance)
+
+        outcomes: list[PushConflictOutcomePayload] = []
+        if global_min_distance is None:
+            return outcomes, kept
+
+        for (
+            pusher_a_piece_id,
+            pusher_b_piece_id,
+        ), distance in head_on_collisions.items():
+            if distance != global_min_distance:
+                continue
+            outcomes.append(
+                PushConflictOutcomePayload(
+                    piece_ids=[pusher_a_piece_id, pusher_b_piece_id],
+                    collision_point=None,
+                )
+            )
+        if outcomes:
+            return outcomes, kept
+
+        for distance, pusher_ids in victim_to_pushers.values():
+            if distance != global_min_distance or len(pusher_ids) < 2:
+                continue
+            outcomes.append(
+                PushConflictOutcomePayload(piece_ids=pusher_ids, collision_point=None)
+            )
+        return outcomes, kept
+
+    def _perform_event(
+        self, action_by_piece_id: dict[uuid.UUID, TimelineEventAction]
+    ) -> TimelineEvent | None:
+        marched = self._march_chains()
+        if marched is None:
+            return None
+        pushers, victim_chain_length = marched
+
+        steps = np.arange(1, victim_chain_length + 1, dtype=np.int64)
+        victim_x = self._x[pushers, None] + self._dx[pushers, None] * steps
+        victim_y = self._y[pushers, None] + self._dy[pushers, None] * steps
+        victim_cells = victim_y * self._width + victim_x
+
+        event = TimelineEvent(actions=[], outcomes=[])
+        conflicts, kept = self._find_push_conflicts(
+            pushers, victim_cells, victim_chain_length
+        )
+        if conflicts:
+            for outcome in conflicts:
+                for piece_id in outcome.piece_ids:
+                    event.actions.append(action_by_piece_id[piece_id])
+                    self._remaining[self._pusher_idx_by_id[piece_id]] = False
+                event.outcomes.append(PushConflictOutcome.build(outcome))
+            return event
+
+        # bucket the pushers by the empty position their chain is moving into
+        target_x = self._x[pushers] + self._dx[pushers] * (kept + 1)
+        target_y = self._y[pushers] + self._dy[pushers] * (kept + 1)
+        offset = victim_chain_length + 2
+        target_keys = (target_y + offset) * (self._width + 2 * offset) + (
+            target_x + offset
+        )
+        _, first_rows, inverse, counts = np.unique(
+            target_keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.reshape(-1)
+        rows_by_target = np.argsort(inverse, kind="stable")
+        target_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        moving = np.ones(pushers.size, dtype=np.bool_)
+        conflicting_targets = np.flatnonzero(counts >= 2)
+        for target in conflicting_targets[np.argsort(first_rows[conflicting_targets])]:
+            start = target_starts[target]
+            rows = rows_by_target[start : start + counts[target]]
+            moving[rows] = False
+            pusher_ids = [self._pusher_ids[idx] for idx in pushers[rows].tolist()]
+            for piece_id in pusher_ids:
+                self._remaining[self._pusher_idx_by_id[piece_id]] = False
+            event.actions.extend(
+                action_by_piece_id[piece_id] for piece_id in pusher_ids
+            )
+            row = int(rows[0])
+            event.outcomes.append(
+                MoveConflictOutcome.build(
+                    MoveConflictOutcomePayload(
+                        piece_ids=pusher_ids,
+                        collision_point=Position(
+                            x=int(target_x[row]) + self._origin_x,
+                            y=int(target_y[row]) + self._origin_y,
+                        ),
+                    )
+                )
+            )
+
+        victim_slots = self._grid[victim_cells].tolist()
+        kept_victims = kept.tolist()
+        push_outcomes: list[PushOutcomePayload] = []
+        moved_piece_ids: list[uuid.UUID] = []
+        for row in np.flatnonzero(moving).tolist():
+            pusher_idx = int(pushers[row])
+            pusher_piece_id = self._pusher_ids[pusher_idx]
+            victim_piece_ids = [
+                self._storage.get_piece_in_slot(slot).piece_id
+                for slot in victim_slots[row][: kept_victims[row]]
+            ]
+            event.actions.append(action_by_piece_id[pusher_piece_id])
+            push_outcome = PushOutcomePayload(
+                pusher_piece_id=pusher_piece_id,
+                victim_piece_ids=victim_piece_ids,
+                direction=self._directions[pusher_idx],
+            )
+            push_outcomes.append(push_outcome)
+            event.outcomes.append(PushOutcome.build(push_outcome))
+            self._remaining[pusher_idx] = False
+            moved_piece_ids.extend(victim_piece_ids)
+
+        self._execute_push_outcomes(push_outcomes)
+        # victims might be pushers themselves
+        self._refresh_pusher_positions(moved_piece_ids)
+
+        return event
+
+    def perform_player_moves(
+        self, action_by_piece_id: dict[uuid.UUID, TimelineEventAction]
+    ) -> list[TimelineEvent]:
+        events: list[TimelineEvent] = []
+        while (event := self._perform_event(action_by_piece_id)) is not None:
+            events.append(event)
+        return events
@@ -0,0 +1,32 @@
+from typing import NamedTuple
+
+from ..models import Direction, Position
+
+DELTA_BY_DIRECTION: dict[Direction, tuple[int, int]] = {
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0),
+    Direction.RIGHT: (1, 0),
+}
+
+
+class Coord(NamedTuple):
+    """Lightweight position used internally by the game engine.
+
+    Unlike `Position` this doesn't go through pydantic validation and hashes like a plain tuple.
+    Convert to `Position` when building models.
+    """
+
+    x: int
+    y: int
+
+    @classmethod
+    def from_position(cls, pos: Position) -> "Coord":
+        return cls(pos.x, pos.y)
+
+    def to_position(self) -> Position:
+        return Position(x=self.x, y=self.y)
+
+    def offset_in_direction(self, direction: Direction, *, steps: int = 1) -> "Coord":
+        dx, dy = DELTA_BY_DIRECTION[direction]
+        return Coord(self.x + dx * steps, self.y + dy * steps)
@@ -0,0 +1,110 @@
+from typing import Iterable, Iterator, MutableMapping, Protocol, TypeVar
+
+_KeyT = TypeVar("_KeyT")
+_ValueT = TypeVar("_ValueT")
+
+# forking a map that already sits on top of this many layers flattens it first
+MAX_LAYER_DEPTH = 16
+
+
+class _Removed:
+    """Marks a key that was removed from the layer below."""
+
+
+_REMOVED = _Removed()
+
+
+class ReadableMapping(Protocol[_KeyT, _ValueT]):
+    def get(self, key: _KeyT, /) -> _ValueT | None:
+        ...
+
+    def items(self) -> Iterable[tuple[_KeyT, _ValueT]]:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+
+class LayeredDict(MutableMapping[_KeyT, _ValueT]):
+    """Dictionary recording its changes on top of a base mapping which is never modified.
+
+    Use `fork` to split a mapping into two independent copies, forking only costs as much as
+    the changes made since the previous fork.
+    Values must not be `None`.
+    """
+
+    _base: ReadableMapping[_KeyT, _ValueT]
+    _changes: dict[_KeyT, _ValueT | _Removed]
+    _len: int
+    _depth: int
+
+    def __init__(self, base: ReadableMapping[_KeyT, _ValueT]) -> None:
+        self._base = base
+        self._changes = {}
+        self._len = len(base)
+        self._depth = base._depth + 1 if isinstance(base, LayeredDict) else 1
+
+    @classmethod
+    def fork(
+        cls, mapping: ReadableMapping[_KeyT, _ValueT]
+    ) -> tuple["LayeredDict[_KeyT, _ValueT]", "LayeredDict[_KeyT, _ValueT]"]:
+        """Split the mapping into two copies sharing all its current entries.
+
+        The mapping itself must not be modified afterwards, use the returned copies instead.
+        """
+        base: ReadableMapping[_KeyT, _ValueT] = mapping
+        if isinstance(mapping, LayeredDict):
+            if not mapping._changes:
+                base = mapping._base
+            elif mapping._depth >= MAX_LAYER_DEPTH:
+                base = dict(mapping.items())
+        return cls(base), cls(base)
+
+    def get(self, key: _KeyT, default: _ValueT | None = None) -> _ValueT | None:  # type: ignore[override]
+        try:
+            value = self._changes[key]
+        except KeyError:
+            value = self._base.get(key)
+            return default if value is None else value
+        if isinstance(value, _Removed):
+            return default
+        return value
+
+    def __getitem__(self, key: _KeyT) -> _ValueT:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None  # type: ignore[arg-type]
+
+    def __setitem__(self, key: _KeyT, value: _ValueT) -> None:
+        if key not in self:
+            self._len += 1
+        self._changes[key] = value
+
+    def __delitem__(self, key: _KeyT) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._len -= 1
+        if self._base.get(key) is None:
+            del self._changes[key]
+        else:
+            self._changes[key] = _REMOVED
+
+    def __iter__(self) -> Iterator[_KeyT]:
+        for key, _ in self.items():
+            yield key
+
+    def items(self) -> Iterator[tuple[_KeyT, _ValueT]]:  # type: ignore[override]
+        changes = self._changes
+        for key, value in changes.items():
+            if not isinstance(value, _Removed):
+                yield key, value
+        for key, value in self._base.items():
+            if key not in changes:
+                yield key, value
+
+    def __len__(self) -> int:
+        return self._len
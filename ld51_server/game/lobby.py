@@ -1,11 +1,11 @@
 import asyncio
 import enum
 import logging
+import os
 import time
 import uuid
 from datetime import datetime
-from random import Random
-from typing import Any, Generic, Iterable, TypeVar
+from typing import Any, Callable, Generic, Iterable, TypeVar
 
 from fastapi import WebSocket, WebSocketDisconnect
 from pydantic import ValidationError
@@ -13,6 +13,8 @@ from pydantic import ValidationError
 from ..models import PlayerInfo, TimelineEventAction
 from ..protocol import (
     BaseMessage,
+    BoardStateMessage,
+    BoardStatePayload,
     ErrorMessage,
     ErrorPayload,
     HostStartGamePayload,
@@ -23,6 +25,7 @@ from ..protocol import (
     PlayerLeftPayload,
     PlayerMovesPayload,
     ReadyForNextRoundPayload,
+    RequestBoardStatePayload,
     RoundResultMessage,
     RoundResultPayload,
     RoundStartMessage,
@@ -33,8 +36,11 @@ from ..protocol import (
     ServerStartGamePayload,
     ws_close_code,
 )
+from ..protocol.codec import DEFAULT_CODEC, CodecABC, Frame
+from ..protocol.compact_ids import CompactIdTable
 from .board import Board, IllegalPlayerMoveError
-from .board_platform import ClientDefinedPlatform
+from .board_executor import BoardExecutionMode, get_board_executor
+from .board_history import BoardStateHistory
 from .player import Player
 
 _LOGGER = logging.getLogger()
@@ -45,6 +51,12 @@ PRE_GAME_DURATION: float = 5.0
 PLAYER_RECONNECT_DURATION: float = 10.0
 DURATION_PER_EVENT: float = 5.0
 PIECES_PER_PLAYER: int = 3
+# board state versions kept to send players only what changed since the version they acknowledged
+BOARD_STATE_HISTORY: int = 4
+# where to run game setup and round resolution, see `BoardExecutionMode`
+BOARD_EXECUTION_MODE: BoardExecutionMode = BoardExecutionMode(
+    os.environ.get("LD51_BOARD_EXECUTION_MODE", BoardExecutionMode.INLINE)
+)
 
 
 class LobbyState(enum.IntEnum):
@@ -54,6 +66,7 @@ class LobbyState(enum.IntEnum):
     GAME_ROUND_START = enum.auto()
     GAME_GET_PLAYER_MOVES = enum.auto()
     GAME_WAIT_PLAYER_READY = enum.auto()
+    GAME_RESOLVE_ROUND = enum.auto()
 
 
 _ItemT = TypeVar("_ItemT")
@@ -148,6 +161,11 @@ class Lobby:
     _player_by_id: dict[uuid.UUID, Player]
 
     _board: Board | None
+    _board_history: BoardStateHistory | None
+    _id_table: CompactIdTable | None
+    _acked_board_version_by_player: dict[uuid.UUID, int]
+    # `time.time()` at which the first round of the game starts
+    _first_round_at: float
     _round_number: int
     _game_loop_task: asyncio.Task[None] | None
 
@@ -164,6 +182,10 @@ class Lobby:
         self._player_by_id = {}
 
         self._board = None
+        self._board_history = None
+        self._id_table = None
+        self._acked_board_version_by_player = {}
+        self._first_round_at = 0.0
         self._round_number = 0
         self._game_loop_task = None
 
@@ -196,6 +218,13 @@ class Lobby:
             )
         return [player.get_player_info_model() for player in players]
 
+    def is_game_running(self) -> bool:
+        match self._state:
+            case LobbyState.EMPTY | LobbyState.SHUTDOWN | LobbyState.LOBBY:
+                return False
+            case _:
+                return True
+
     def is_joinable(self) -> bool:
         match self._state:
             case LobbyState.EMPTY | LobbyState.LOBBY:
@@ -207,12 +236,8 @@ class Lobby:
         if task := self._game_loop_task:
             task.cancel()
         self._state = LobbyState.SHUTDOWN
-        await asyncio.gather(
-            *(
-                player.disconnect_silent(ws_close_code.LOBBY_SHUTDOWN)
-                for player in self._player_by_id.values()
-            )
-        )
+        for player in self._player_by_id.values():
+            player.disconnect(ws_close_code.LOBBY_SHUTDOWN)
 
     def _get_next_player_number(self) -> int:
         used_player_numbers = sorted(
@@ -239,13 +264,11 @@ class Lobby:
             )
         )
 
-    async def _inform_player_connected(
-        self, player: Player, *, reconnect: bool
-    ) -> None:
+    def _inform_player_connected(self, player: Player, *, reconnect: bool) -> None:
         player_info_model = player.get_player_info_model()
 
         # send 'server hello' to the newly connected player
-        await player.send_msg_silent(
+        player.queue_msg(
             ServerHelloMessage.from_payload(
                 ServerHelloPayload(
                     session_id=player.session_id,
@@ -258,7 +281,7 @@ class Lobby:
             )
         )
         # send 'player joined' to everyone else
-        await self._broadcast(
+        self._broadcast(
             PlayerJoinedMessage.from_payload(
                 PlayerJoinedPayload(player=player_info_model, reconnect=reconnect)
             ),
@@ -266,7 +289,14 @@ class Lobby:
         )
 
     async def reconnect_player(
-        self, ws: WebSocket, session_id: uuid.UUID
+        self,
+        ws: WebSocket,
+        session_id: uuid.UUID,
+        *,
+        codec: CodecABC = DEFAULT_CODEC,
+        subprotocol: str | None = None,
+        compact_ids: bool = False,
+        compression: bool = False,
     ) -> Player | None:
         player: Player
         for player in self._player_by_id.values():
@@ -275,21 +305,44 @@ class Lobby:
         else:
             return None
 
-        await ws.accept()
-        player.replace_ws(ws)
+        await ws.accept(subprotocol=subprotocol)
+        player.replace_ws(
+            ws, codec=codec, compact_ids=compact_ids, compression=compression
+        )
         self._set_player_poll_task(player)
 
         _LOGGER.info("player %s reconnected", player.player_id)
-        await self._inform_player_connected(player, reconnect=True)
+        self._inform_player_connected(player, reconnect=True)
+
+        if self.is_game_running():
+            # resend the start of the game so the player can rebuild the board
+            self._acked_board_version_by_player.pop(player.player_id, None)
+            if player.compact_ids:
+                player.set_id_table(self._id_table)
+            player.queue_msg(self._encode_server_start_game_msg(player))
 
-        # TODO: bring the player up to speed with what's currently happening
+        # TODO: bring the player up to speed with the current round
         return player
 
-    async def join_player(self, ws: WebSocket) -> Player:
+    async def join_player(
+        self,
+        ws: WebSocket,
+        *,
+        codec: CodecABC = DEFAULT_CODEC,
+        subprotocol: str | None = None,
+        compact_ids: bool = False,
+        compression: bool = False,
+    ) -> Player:
         assert self.is_joinable
 
-        await ws.accept()
-        player = Player(ws, player_number=self._get_next_player_number())
+        await ws.accept(subprotocol=subprotocol)
+        player = Player(
+            ws,
+            player_number=self._get_next_player_number(),
+            codec=codec,
+            compact_ids=compact_ids,
+            compression=compression,
+        )
         if self._host_player_id is None:
             self._host_player_id = player.player_id
             self._state = LobbyState.LOBBY
@@ -301,7 +354,7 @@ class Lobby:
         self._player_by_id[player.player_id] = player
         self._set_player_poll_task(player)
 
-        await self._inform_player_connected(player, reconnect=False)
+        self._inform_player_connected(player, reconnect=False)
         return player
 
     async def __player_poll_loop(self, player: Player) -> None:
@@ -314,7 +367,7 @@ class Lobby:
                 _LOGGER.warning(
                     "player %s sent an invalid message: %s", player.player_id, exc
                 )
-                await player.disconnect(ws_close_code.INVALID_MESSAGE)
+                player.disconnect(ws_close_code.INVALID_MESSAGE)
                 break
 
             try:
@@ -339,9 +392,9 @@ class Lobby:
         # the player hasn't reconnected in time
         await asyncio.shield(self._on_player_leave(player))
 
-    async def _broadcast(
+    def _broadcast(
         self,
-        msg: BaseMessage[Any, Any],
+        msg: BaseMessage[Any, Any] | Callable[[Player], Frame],
         *,
         include_player_ids: set[uuid.UUID] | None = None,
         exclude_player_ids: set[uuid.UUID] | None = None,
@@ -363,27 +416,33 @@ class Lobby:
         if not players:
             return
 
+        # `msg` may also be a function that encodes the message for the given player
         _LOGGER.debug("broadcasting message to %s player(s)", len(players))
-        exceptions = await asyncio.gather(
-            *(player.send_msg(msg) for player in players), return_exceptions=True
-        )
-        for player, exc in zip(players, exceptions):
-            if exc is None:
-                continue
-            _LOGGER.warning(
-                "failed to send message to player %s: %s", player.player_id, exc
-            )
+        # the frame only depends on the player's `wire_key`, so we only encode it once per key
+        frame_by_key: dict[tuple[CodecABC, CompactIdTable | None, bool], Frame] = {}
+        for player in players:
+            if player.wire_key not in frame_by_key:
+                frame_by_key[player.wire_key] = (
+                    msg(player) if callable(msg) else player.encode_msg(msg)
+                )
+        # only queued, a slow client doesn't hold up the others
+        for player in players:
+            if not player.queue_msg(frame_by_key[player.wire_key]):
+                _LOGGER.warning(
+                    "dropped message for disconnected player %s", player.player_id
+                )
 
     async def _on_player_leave(self, player: Player) -> None:
         _LOGGER.info("player %s left the lobby", player.player_id)
 
         del self._player_by_id[player.player_id]
         player.set_poll_task(None)
+        player.stop_sending()
 
         if self._state == LobbyState.SHUTDOWN:
             return
 
-        await self._broadcast(
+        self._broadcast(
             PlayerLeftMessage.from_payload(
                 PlayerLeftPayload(player=player.get_player_info_model())
             ),
@@ -404,11 +463,31 @@ class Lobby:
                 error = await self._msg_player_moves(player, msg.payload)
             case ReadyForNextRoundPayload():
                 error = await self._msg_ready_for_next_round(player, msg.payload)
+            case RequestBoardStatePayload():
+                error = await self._msg_request_board_state(player, msg.payload)
             case _:
                 error = ErrorPayload.unhandled_message()
 
         if error is not None:
-            await player.send_msg_silent(ErrorMessage.from_payload(error))
+            player.queue_msg(ErrorMessage.from_payload(error))
+
+    def _encode_server_start_game_msg(self, player: Player) -> Frame:
+        assert self._board is not None
+        assert self._board_history is not None
+        # the platform is by far the biggest part of the message, it's only encoded once per game
+        msg = ServerStartGameMessage.construct(
+            type=ServerStartGameMessage.get_type_value(),
+            payload=ServerStartGamePayload.construct(
+                players=self.get_player_info_models(),
+                board_version=self._board_history.version,
+                pieces=self._board_history.pieces,
+                round_start_in=max(self._first_round_at - time.time(), 0.0),
+            ),
+        )
+        encoded_fields = {"platform": self._board.platform.encode_model(player.codec)}
+        if player.id_table is not None:
+            encoded_fields["id_handles"] = player.codec.encode_obj(player.id_table.ids)
+        return player.encode_msg_with_fields(msg, encoded_fields)
 
     async def _msg_host_start_game(
         self, player: Player, payload: HostStartGamePayload
@@ -420,27 +499,33 @@ class Lobby:
 
         # TODO: perhaps we shouldn't allow the host to start the game if there's only one player...
 
-        platform = ClientDefinedPlatform(payload.platform)
         # TODO validate platform, make sure it makes some sense
         self._state = LobbyState.GAME_ROUND_START
-        self._board = Board(platform=platform)
-        rng = Random()
-        self._board.place_pieces(
-            rng, list(self._player_by_id.keys()), PIECES_PER_PLAYER
+        self._board = await get_board_executor(BOARD_EXECUTION_MODE).setup_board(
+            payload.platform, list(self._player_by_id.keys()), PIECES_PER_PLAYER
+        )
+        self._board_history = BoardStateHistory(
+            self._board.get_pieces_model(), max_versions=BOARD_STATE_HISTORY
+        )
+        self._acked_board_version_by_player.clear()
+        # players first, ordered by their number
+        players = sorted(
+            self._player_by_id.values(), key=lambda player: player.player_number
+        )
+        self._id_table = CompactIdTable(
+            (
+                *(player.player_id for player in players),
+                *(piece.piece_id for piece in self._board_history.pieces),
+            )
         )
+        for player in players:
+            if player.compact_ids:
+                player.set_id_table(self._id_table)
 
         round_start_in = PRE_GAME_DURATION
+        self._first_round_at = time.time() + round_start_in
 
-        await self._broadcast(
-            ServerStartGameMessage.from_payload(
-                ServerStartGamePayload(
-                    platform=platform.to_model(),
-                    players=self.get_player_info_models(),
-                    pieces=self._board.get_pieces_model(),
-                    round_start_in=round_start_in,
-                )
-            )
-        )
+        self._broadcast(self._encode_server_start_game_msg)
 
         await asyncio.sleep(round_start_in)
 
@@ -478,10 +563,58 @@ class Lobby:
         assert self._board
         assert self._player_ready_collector
 
+        if payload.board_version is not None:
+            self._acked_board_version_by_player[
+                player.player_id
+            ] = payload.board_version
         self._player_ready_collector.collect(player.player_id, payload)
 
+    async def _msg_request_board_state(
+        self, player: Player, payload: RequestBoardStatePayload
+    ) -> ErrorPayload | None:
+        if self._board_history is None or not self.is_game_running():
+            return ErrorPayload.invalid_lobby_state()
+
+        # only the latest board state matters if the client is behind
+        player.queue_msg(
+            BoardStateMessage.from_payload(
+                BoardStatePayload(
+                    board_version=self._board_history.version,
+                    board_state=self._board_history.pieces,
+                )
+            ),
+            supersede_key=BoardStateMessage.get_type_value(),
+        )
+
+    def _build_round_start_msg(
+        self, base_board_version: int | None
+    ) -> RoundStartMessage:
+        """Only the changes since `base_board_version` if it's known, otherwise the full board state."""
+        assert self._board_history is not None
+        diff = None
+        if base_board_version is not None:
+            diff = self._board_history.diff(base_board_version)
+
+        if diff is None:
+            base_board_version = None
+            board_state, removed_piece_ids = self._board_history.pieces, []
+        else:
+            board_state, removed_piece_ids = diff
+
+        return RoundStartMessage.from_payload(
+            RoundStartPayload(
+                round_number=self._round_number,
+                round_duration=ROUND_DURATION,
+                board_version=self._board_history.version,
+                base_board_version=base_board_version,
+                board_state=board_state,
+                removed_piece_ids=removed_piece_ids,
+            )
+        )
+
     async def __run_round(self) -> bool:
         assert self._board is not None
+        assert self._board_history is not None
 
         self._round_number += 1
 
@@ -489,15 +622,16 @@ class Lobby:
         # TODO: we only care for players that still have pieces on the board
         self._player_moves_collector = PlayerItemCollector(self._player_by_id.keys())
 
-        await self._broadcast(
-            RoundStartMessage.from_payload(
-                RoundStartPayload(
-                    round_number=self._round_number,
-                    round_duration=ROUND_DURATION,
-                    board_state=self._board.get_pieces_model(),
-                )
+        # players with the same acknowledged version get the same message
+        player_ids_by_base_version: dict[int | None, set[uuid.UUID]] = {}
+        for player_id in self._player_by_id:
+            base_version = self._acked_board_version_by_player.get(player_id)
+            player_ids_by_base_version.setdefault(base_version, set()).add(player_id)
+        for base_version, player_ids in player_ids_by_base_version.items():
+            self._broadcast(
+                self._build_round_start_msg(base_version),
+                include_player_ids=player_ids,
             )
-        )
 
         # collect moves by all players
         collect_result = await self._player_moves_collector.wait_with_grace_period(
@@ -507,17 +641,22 @@ class Lobby:
         for player_id in collect_result.missing_player_ids:
             # disconnect all player that didn't submit any moves
             if player := self._player_by_id.get(player_id):
-                await player.disconnect_silent(ws_close_code.NO_MOVES_SUBMITTED)
+                player.disconnect(ws_close_code.NO_MOVES_SUBMITTED)
 
         # execute moves
-        timeline = self._board.perform_all_player_moves(collect_result.collected)
+        self._state = LobbyState.GAME_RESOLVE_ROUND
+        executor = get_board_executor(BOARD_EXECUTION_MODE)
+        self._board, timeline = await executor.perform_all_player_moves(
+            self._board, collect_result.collected
+        )
+        self._board_history.push(self._board.get_pieces_model())
         estimated_animation_duration = len(timeline) * DURATION_PER_EVENT
 
         self._state = LobbyState.GAME_WAIT_PLAYER_READY
         self._player_ready_collector = PlayerItemCollector(self._player_by_id.keys())
 
         game_over_model = self._board.get_game_over_model()
-        await self._broadcast(
+        self._broadcast(
             RoundResultMessage.from_payload(
                 RoundResultPayload(
                     timeline=timeline,
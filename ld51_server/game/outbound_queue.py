@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import dataclasses
+import logging
+
+from fastapi import WebSocket
+
+from ..protocol import ws_close_code
+from ..protocol.codec import Frame
+
+_LOGGER = logging.getLogger()
+
+
+@dataclasses.dataclass(kw_only=True)
+class _Item:
+    frame: Frame | None
+    # the websocket is closed with this code instead of sending a frame
+    close_code: ws_close_code.Code | None = None
+    supersede_key: str | None = None
+    deadline: float
+
+
+class OutboundQueue:
+    """Frames waiting to be sent over a websocket by a dedicated writer task.
+
+    Putting frames into the queue never waits for the websocket. A client that can't keep up
+    is disconnected with `CLIENT_TOO_SLOW`: when the queue overflows, or when a frame couldn't
+    be sent before its deadline.
+    """
+
+    _ws: WebSocket
+    _max_size: int
+    _send_deadline: float
+    _items: collections.deque[_Item]
+    _wakeup: asyncio.Event
+    _closing: bool
+    _writer_task: asyncio.Task[None]
+
+    def __init__(self, ws: WebSocket, *, max_size: int, send_deadline: float) -> None:
+        assert max_size > 0
+        self._ws = ws
+        self._max_size = max_size
+        self._send_deadline = send_deadline
+        self._items = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._writer_task = asyncio.create_task(
+            self.__write_loop(), name="outbound queue writer"
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def closing(self) -> bool:
+        """Whether the websocket is (about to be) closed, new frames are dropped."""
+        return self._closing
+
+    def put(self, frame: Frame, *, supersede_key: str | None = None) -> bool:
+        """Queue the frame, `False` if it was dropped.
+
+        A frame with a `supersede_key` replaces a frame with the same key that wasn't sent yet.
+        """
+        if self._closing:
+            return False
+
+        if supersede_key is not None:
+            for item in self._items:
+                if item.supersede_key == supersede_key:
+                    item.frame = frame
+                    return True
+
+        if len(self._items) >= self._max_size:
+            _LOGGER.warning("outbound queue overflowed, disconnecting the client")
+            self._items.clear()
+            self.close(ws_close_code.CLIENT_TOO_SLOW)
+            return False
+
+        self._items.append(
+            _Item(
+                frame=frame,
+                supersede_key=supersede_key,
+                deadline=self._now() + self._send_deadline,
+            )
+        )
+        self._wakeup.set()
+        return True
+
+    def close(self, code: ws_close_code.Code) -> None:
+        """Close the websocket once the frames that are already queued have been sent."""
+        if self._closing:
+            return
+        self._closing = True
+        self._items.append(
+            _Item(
+                frame=None, close_code=code, deadline=self._now() + self._send_deadline
+            )
+        )
+        self._wakeup.set()
+
+    def abort(self) -> None:
+        """Stop the writer without sending anything else, the websocket is gone."""
+        self._closing = True
+        self._items.clear()
+        self._writer_task.cancel()
+
+    async def wait_closed(self) -> None:
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    async def _send(self, item: _Item) -> None:
+        if item.close_code is not None:
+            await self._ws.close(**item.close_code)
+        elif isinstance(item.frame, str):
+            await self._ws.send_text(item.frame)
+        else:
+            assert item.frame is not None
+            await self._ws.send_bytes(item.frame)
+
+    async def __write_loop(self) -> None:
+        while True:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            item = self._items.popleft()
+            try:
+                await asyncio.wait_for(
+                    self._send(item), timeout=max(item.deadline - self._now(), 0.0)
+                )
+            except asyncio.TimeoutError:
+                _LOGGER.warning("send deadline exceeded, disconnecting the client")
+                break
+            # sending fails if the client is gone, the poll loop takes care of that
+            # pylint: disable-next=broad-except
+            except Exception as exc:
+                _LOGGER.warning("failed to send to the client: %s", exc)
+                self._closing = True
+                self._items.clear()
+                return
+
+            if item.close_code is not None:
+                self._items.clear()
+                return
+
+        self._closing = True
+        self._items.clear()
+        try:
+            await asyncio.wait_for(
+                self._ws.close(**ws_close_code.CLIENT_TOO_SLOW),
+                timeout=self._send_deadline,
+            )
+        # pylint: disable-next=broad-except
+        except Exception:
+            pass
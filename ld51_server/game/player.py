@@ -1,17 +1,23 @@
 import asyncio
 import logging
 import uuid
-from typing import Any
+from typing import Any, Iterable
 
-from fastapi import WebSocket, WebSocketDisconnect
-from fastapi.encoders import jsonable_encoder
+from fastapi import WebSocket
 
 from ..models import PlayerInfo
 from ..protocol import BaseMessage, Message, ws_close_code
+from ..protocol.codec import DEFAULT_CODEC, CodecABC, Frame, WireFormat
+from ..protocol.compact_ids import CompactIdTable
+from ..protocol.compression import compress_frame
+from .outbound_queue import OutboundQueue
 
 _LOGGER = logging.getLogger()
 
-_WS_MODE = "text"
+# frames waiting to be sent before a client is considered too slow
+OUTBOUND_QUEUE_SIZE: int = 64
+# seconds a frame may wait in the queue and take to send
+SEND_DEADLINE: float = 5.0
 
 
 class Player:
@@ -19,13 +25,32 @@ class Player:
     _number: int
     _session_id: uuid.UUID
     _ws: WebSocket
+    _outbound: OutboundQueue
+    _codec: CodecABC
+    _compact_ids: bool
+    _compression: bool
+    _id_table: CompactIdTable | None
     _poll_task: asyncio.Task[None] | None
 
-    def __init__(self, ws: WebSocket, *, player_number: int) -> None:
+    def __init__(
+        self,
+        ws: WebSocket,
+        *,
+        player_number: int,
+        codec: CodecABC = DEFAULT_CODEC,
+        compact_ids: bool = False,
+        compression: bool = False,
+    ) -> None:
+        assert not compression or codec.wire_format != WireFormat.JSON
         self._id = uuid.uuid4()
         self._number = player_number
         self._session_id = uuid.uuid4()
         self._ws = ws
+        self._outbound = self._create_outbound_queue(ws)
+        self._codec = codec
+        self._compact_ids = compact_ids
+        self._compression = compression
+        self._id_table = None
         self._poll_task = None
 
     @property
@@ -40,8 +65,51 @@ class Player:
     def session_id(self) -> uuid.UUID:
         return self._session_id
 
-    def replace_ws(self, ws: WebSocket) -> None:
+    @property
+    def codec(self) -> CodecABC:
+        return self._codec
+
+    @property
+    def compact_ids(self) -> bool:
+        """Whether the client wants small integer handles instead of UUIDs."""
+        return self._compact_ids
+
+    @property
+    def compression(self) -> bool:
+        """Whether large frames are sent in a compressed envelope, see `compress_frame`."""
+        return self._compression
+
+    @property
+    def id_table(self) -> CompactIdTable | None:
+        return self._id_table
+
+    @property
+    def wire_key(self) -> tuple[CodecABC, CompactIdTable | None, bool]:
+        """Players with the same key get the same frame for a message."""
+        return self._codec, self._id_table, self._compression
+
+    def set_id_table(self, id_table: CompactIdTable | None) -> None:
+        """Start translating ids with the table, the client must have received it before."""
+        assert id_table is None or self._compact_ids
+        self._id_table = id_table
+
+    def replace_ws(
+        self,
+        ws: WebSocket,
+        *,
+        codec: CodecABC = DEFAULT_CODEC,
+        compact_ids: bool = False,
+        compression: bool = False,
+    ) -> None:
+        assert not compression or codec.wire_format != WireFormat.JSON
+        self._outbound.abort()
         self._ws = ws
+        self._outbound = self._create_outbound_queue(ws)
+        self._codec = codec
+        self._compact_ids = compact_ids
+        self._compression = compression
+        # the new client doesn't know the table yet
+        self._id_table = None
 
     def get_player_info_model(self) -> PlayerInfo:
         return PlayerInfo(
@@ -49,13 +117,22 @@ class Player:
             number=self._number,
         )
 
+    @staticmethod
+    def _create_outbound_queue(ws: WebSocket) -> OutboundQueue:
+        return OutboundQueue(
+            ws, max_size=OUTBOUND_QUEUE_SIZE, send_deadline=SEND_DEADLINE
+        )
+
     async def wait_until_done(self) -> None:
-        if self._poll_task is None:
-            return
-        try:
-            await self._poll_task
-        except asyncio.CancelledError:
-            pass
+        # a reconnect replaces the queue, we only care about the one of this websocket
+        outbound = self._outbound
+        if self._poll_task is not None:
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+        # let the writer send the close frame
+        await outbound.wait_closed()
 
     def set_poll_task(self, poll_task: asyncio.Task[None] | None) -> None:
         if existing_poll_task := self._poll_task:
@@ -63,32 +140,65 @@ class Player:
 
         self._poll_task = poll_task
 
-    async def send_msg(self, msg: BaseMessage[Any, Any]) -> None:
-        """
-        Raises `WebSocketDisconnect`.
-        """
-        await self._ws.send_json(jsonable_encoder(msg), mode=_WS_MODE)
+    def _to_wire_obj(
+        self, msg: BaseMessage[Any, Any], *, exclude_payload_fields: Iterable[str] = ()
+    ) -> dict[str, Any]:
+        obj = msg.dict(exclude={"payload": set(exclude_payload_fields)})
+        if self._id_table is not None:
+            obj = self._id_table.compact(obj)
+        return obj
+
+    def _finish_frame(self, frame: Frame) -> Frame:
+        if self._compression:
+            assert isinstance(frame, bytes)
+            return compress_frame(frame)
+        return frame
+
+    def encode_msg(self, msg: BaseMessage[Any, Any]) -> Frame:
+        return self._finish_frame(self._codec.encode_obj(self._to_wire_obj(msg)))
+
+    def encode_msg_with_fields(
+        self, msg: BaseMessage[Any, Any], encoded_fields: dict[str, Frame]
+    ) -> Frame:
+        """See `CodecABC.encode_with_fields`, the fields must be encoded with the player's codec."""
+        return self._finish_frame(
+            self._codec.encode_obj_with_fields(
+                self._to_wire_obj(msg, exclude_payload_fields=encoded_fields),
+                encoded_fields,
+            )
+        )
 
-    async def send_msg_silent(self, msg: BaseMessage[Any, Any]) -> bool:
-        try:
-            await self.send_msg(msg)
-        except WebSocketDisconnect:
-            return False
-        return True
+    def queue_msg(
+        self,
+        msg: BaseMessage[Any, Any] | Frame,
+        *,
+        supersede_key: str | None = None,
+    ) -> bool:
+        """Queue the message to be sent, `False` if it was dropped because the client is gone.
+
+        A `Frame` is sent as is, it must come from `encode_msg` of a player with the same `wire_key`.
+        See `OutboundQueue.put` for `supersede_key`.
+        """
+        if isinstance(msg, BaseMessage):
+            msg = self.encode_msg(msg)
+        return self._outbound.put(msg, supersede_key=supersede_key)
 
     async def receive_msg(self) -> Message:
         """
         Raises `WebSocketDisconnect` or `ValidationError`.
         """
-        raw_msg = await self._ws.receive_json(mode=_WS_MODE)
-        return Message.parse_obj(raw_msg)
-
-    async def disconnect(self, code: ws_close_code.Code) -> None:
-        await self._ws.close(**code)
-
-    async def disconnect_silent(self, code: ws_close_code.Code) -> bool:
-        try:
-            await self.disconnect(code)
-        except WebSocketDisconnect:
-            return False
-        return True
+        if self._codec.wire_format == WireFormat.JSON:
+            obj = self._codec.decode_obj(await self._ws.receive_text())
+        else:
+            obj = self._codec.decode_obj(await self._ws.receive_bytes())
+        if self._id_table is not None:
+            obj = self._id_table.expand(obj)
+        return Message.parse_obj(obj)
+
+    def disconnect(self, code: ws_close_code.Code) -> None:
+        """Close the websocket after sending the queued messages."""
+        self._outbound.close(code)
+
+    def stop_sending(self) -> None:
+        """Drop the queued messages, the player left."""
+        self._outbound.abort()
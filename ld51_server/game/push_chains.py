@@ -0,0 +1,189 @@
+import uuid
+from typing import Iterable, Mapping
+
+from ..models import Direction
+from .board_storage import PieceInformation, PieceStorageABC
+from .coord import DELTA_BY_DIRECTION, Coord
+
+
+class _PushChain:
+    __slots__ = ("victims", "victim_count", "path")
+
+    # `None` if the walk was cut short, `victim_count` is then only a lower bound
+    victims: list[PieceInformation] | None
+    victim_count: int
+    # the pusher followed by every position the walk looked at
+    path: list[tuple[int, int]]
+
+    def __init__(
+        self,
+        victims: list[PieceInformation] | None,
+        victim_count: int,
+        path: list[tuple[int, int]],
+    ) -> None:
+        self.victims = victims
+        self.victim_count = victim_count
+        self.path = path
+
+
+class PushChainCache:
+    """Push chains of the remaining moves, kept up to date between move events.
+
+    Every chain is registered on all the positions it covers. After an event only the
+    chains covering a position whose occupant changed have to be walked again, all other
+    chains are reused as they are.
+    Walks stop as soon as the chain is longer than the shortest one known, such a chain
+    only remembers that it's longer and is walked again once that could matter.
+
+    Internally pushers are referred to by the index of their move, which is cheaper to hash than a UUID.
+    """
+
+    _storage: PieceStorageABC
+    _position_by_piece_id: Mapping[uuid.UUID, Coord]
+    _remaining_moves_by_piece_id: dict[uuid.UUID, Direction]
+
+    _pusher_ids: list[uuid.UUID]
+    _pusher_idx_by_id: dict[uuid.UUID, int]
+    _chain_by_pusher: dict[int, _PushChain]
+    _pushers_by_position: dict[tuple[int, int], set[int]]
+    _pushers_by_victim_count: dict[int, set[int]]
+    _truncated_pushers_by_victim_count: dict[int, set[int]]
+    _dirty_pushers: set[int]
+
+    def __init__(
+        self,
+        storage: PieceStorageABC,
+        position_by_piece_id: Mapping[uuid.UUID, Coord],
+        remaining_moves_by_piece_id: dict[uuid.UUID, Direction],
+    ) -> None:
+        self._storage = storage
+        self._position_by_piece_id = position_by_piece_id
+        # NOTE: this is shared with the caller, pushers are removed from it as they're resolved
+        self._remaining_moves_by_piece_id = remaining_moves_by_piece_id
+
+        self._pusher_ids = list(remaining_moves_by_piece_id)
+        self._pusher_idx_by_id = {
+            piece_id: idx for idx, piece_id in enumerate(self._pusher_ids)
+        }
+        self._chain_by_pusher = {}
+        self._pushers_by_position = {}
+        self._pushers_by_victim_count = {}
+        self._truncated_pushers_by_victim_count = {}
+        self._dirty_pushers = set(range(len(self._pusher_ids)))
+
+    def _unregister(self, pusher_idx: int) -> None:
+        chain = self._chain_by_pusher.pop(pusher_idx, None)
+        if chain is None:
+            return
+
+        pushers_by_position = self._pushers_by_position
+        for pos in chain.path:
+            pushers = pushers_by_position[pos]
+            if len(pushers) == 1:
+                del pushers_by_position[pos]
+            else:
+                pushers.discard(pusher_idx)
+
+        if chain.victims is None:
+            buckets = self._truncated_pushers_by_victim_count
+        else:
+            buckets = self._pushers_by_victim_count
+        pushers = buckets[chain.victim_count]
+        if len(pushers) == 1:
+            del buckets[chain.victim_count]
+        else:
+            pushers.discard(pusher_idx)
+
+    def _walk(self, pusher_idx: int, max_len: int | None) -> None:
+        pusher_piece_id = self._pusher_ids[pusher_idx]
+        pusher_pos = self._position_by_piece_id.get(pusher_piece_id)
+        if pusher_pos is None:
+            # this piece no longer exists
+            del self._remaining_moves_by_piece_id[pusher_piece_id]
+            return
+
+        push_dir = self._remaining_moves_by_piece_id[pusher_piece_id]
+        victims = self._storage.walk_chain(pusher_pos, push_dir, max_len=max_len)
+        if victims is None:
+            assert max_len is not None
+            # the walk looked at the first `max_len + 1` victims
+            victim_count = max_len + 1
+            path_len = victim_count + 1
+            buckets = self._truncated_pushers_by_victim_count
+        else:
+            # the walk looked at all victims and the empty position after them
+            victim_count = len(victims)
+            path_len = victim_count + 2
+            buckets = self._pushers_by_victim_count
+
+        dx, dy = DELTA_BY_DIRECTION[push_dir]
+        x, y = pusher_pos
+        # plain tuples compare and hash just like `Coord` but are cheaper to build
+        path = [(x + dx * steps, y + dy * steps) for steps in range(path_len)]
+
+        self._chain_by_pusher[pusher_idx] = _PushChain(victims, victim_count, path)
+        pushers_by_position = self._pushers_by_position
+        for pos in path:
+            if (pushers := pushers_by_position.get(pos)) is not None:
+                pushers.add(pusher_idx)
+            else:
+                pushers_by_position[pos] = {pusher_idx}
+        if (pushers := buckets.get(victim_count)) is not None:
+            pushers.add(pusher_idx)
+        else:
+            buckets[victim_count] = {pusher_idx}
+
+    def _shortest_victim_count(self) -> int | None:
+        return min(self._pushers_by_victim_count, default=None)
+
+    def _rewalk(self, pushers: Iterable[int], *, capped: bool) -> None:
+        for pusher_idx in pushers:
+            self._unregister(pusher_idx)
+            max_len = self._shortest_victim_count() if capped else None
+            self._walk(pusher_idx, max_len)
+
+    def remove(self, pusher_piece_id: uuid.UUID) -> None:
+        """Remove a pusher whose move has been resolved."""
+        del self._remaining_moves_by_piece_id[pusher_piece_id]
+        pusher_idx = self._pusher_idx_by_id[pusher_piece_id]
+        self._unregister(pusher_idx)
+        self._dirty_pushers.discard(pusher_idx)
+
+    def mark_positions_changed(self, positions: Iterable[Coord]) -> None:
+        """Invalidate all chains covering positions which were vacated or occupied."""
+        for pos in positions:
+            if pushers := self._pushers_by_position.get(pos):
+                self._dirty_pushers.update(pushers)
+
+    def isolate_complete_push_chains(
+        self, complete_push_chains: dict[uuid.UUID, list[uuid.UUID]]
+    ) -> int:
+        """Collect the shortest push chains, these are the ones that are complete.
+
+        The chains are added in the order of the remaining moves. Returns the number of victims in every chain.
+        """
+        self._rewalk(self._dirty_pushers, capped=True)
+        self._dirty_pushers.clear()
+
+        # chains which were cut short earlier might be just as short as the shortest one now
+        truncated = self._truncated_pushers_by_victim_count
+        while truncated:
+            victim_count = min(truncated)
+            shortest = self._shortest_victim_count()
+            if shortest is not None and victim_count > shortest:
+                break
+            self._rewalk(list(truncated[victim_count]), capped=False)
+
+        victim_chain_length = self._shortest_victim_count()
+        if victim_chain_length is None:
+            return -1
+
+        for pusher_idx in sorted(self._pushers_by_victim_count[victim_chain_length]):
+            pusher_piece_id = self._pusher_ids[pusher_idx]
+            victims = self._chain_by_pusher[pusher_idx].victims
+            assert victims is not None
+            complete_push_chains[pusher_piece_id] = [
+                pusher_piece_id,
+                *(victim.piece_id for victim in victims),
+            ]
+        return victim_chain_length
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, WebSocket, status
 from pydantic import BaseModel
 
 from ..protocol import ws_close_code
+from ..protocol.codec import CODEC_BY_WIRE_FORMAT, WireFormat
 from .lobby_manager import LobbyManager, get_lobby_manager
 
 __all__ = ["router"]
@@ -54,13 +55,29 @@ async def create_lobby(*, lobby_manager: LobbyManager = Depends(get_lobby_manage
     )
 
 
+def _negotiate_wire_format(
+    ws: WebSocket, encoding: WireFormat | None
+) -> tuple[WireFormat, str | None]:
+    """The wire format requested by the client and the subprotocol to accept the websocket with.
+
+    A format offered as subprotocol takes precedence over the `encoding` query parameter.
+    """
+    subprotocols: list[str] = ws.scope.get("subprotocols", [])
+    if wire_format := WireFormat.from_subprotocols(subprotocols):
+        return wire_format, wire_format.subprotocol
+    return encoding or WireFormat.JSON, None
+
+
 @router.websocket("/{id_or_code}/join")
 async def ws_join_lobby(
     id_or_code: uuid.UUID | str,
     ws: WebSocket,
     *,
     session_id: uuid.UUID | None = None,
-    lobby_manager: LobbyManager = Depends(get_lobby_manager)
+    encoding: WireFormat | None = None,
+    compact_ids: bool = False,
+    compression: bool = False,
+    lobby_manager: LobbyManager = Depends(get_lobby_manager),
 ):
     if isinstance(id_or_code, uuid.UUID):
         lobby = lobby_manager.get_lobby(id_or_code)
@@ -73,14 +90,35 @@ async def ws_join_lobby(
 
     _LOGGER.debug("joining lobby %s with session id %s", lobby.lobby_id, session_id)
 
+    wire_format, subprotocol = _negotiate_wire_format(ws, encoding)
+    codec = CODEC_BY_WIRE_FORMAT.get(wire_format)
+    if codec is None:
+        await ws.close(**ws_close_code.UNSUPPORTED_WIRE_FORMAT)
+        raise HTTPException(status.HTTP_400_BAD_REQUEST)
+    # text frames are compressed by the permessage-deflate extension if the client supports it
+    compression = compression and wire_format != WireFormat.JSON
+
     if session_id is None:
         if not lobby.is_joinable():
             await ws.close(**ws_close_code.LOBBY_NOT_JOINABLE)
             raise HTTPException(status.HTTP_409_CONFLICT)
 
-        player = await lobby.join_player(ws)
+        player = await lobby.join_player(
+            ws,
+            codec=codec,
+            subprotocol=subprotocol,
+            compact_ids=compact_ids,
+            compression=compression,
+        )
     else:
-        player = await lobby.reconnect_player(ws, session_id)
+        player = await lobby.reconnect_player(
+            ws,
+            session_id,
+            codec=codec,
+            subprotocol=subprotocol,
+            compact_ids=compact_ids,
+            compression=compression,
+        )
         if player is None:
             await ws.close(**ws_close_code.LOBBY_SESSION_EXPIRED)
             raise HTTPException(status.HTTP_410_GONE)
@@ -0,0 +1,209 @@
+import abc
+import enum
+import json
+import uuid
+from typing import Any, ClassVar, NoReturn
+
+from pydantic import BaseModel, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+
+from . import Message
+from .base import BaseMessage
+
+try:
+    import orjson
+except ImportError:  # orjson isn't installed
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack isn't installed
+    msgpack = None
+
+# a text frame for `str` and a binary frame for `bytes`
+Frame = str | bytes
+
+
+class WireFormat(str, enum.Enum):
+    JSON = "json"
+    # UUIDs are sent as 16 raw bytes
+    MSGPACK = "msgpack"
+
+    @property
+    def subprotocol(self) -> str:
+        """Websocket subprotocol clients can use to select the format."""
+        return f"ld51.{self.value}"
+
+    @classmethod
+    def from_subprotocols(cls, subprotocols: list[str]) -> "WireFormat | None":
+        """The first format offered by the client, if any."""
+        for subprotocol in subprotocols:
+            for wire_format in cls:
+                if wire_format.subprotocol == subprotocol:
+                    return wire_format
+        return None
+
+
+class CodecABC(abc.ABC):
+    """Turns messages into websocket frames and back."""
+
+    wire_format: ClassVar[WireFormat]
+
+    @abc.abstractmethod
+    def encode_obj(self, obj: Any) -> Frame:
+        """Encode the result of `BaseModel.dict()`."""
+
+    @abc.abstractmethod
+    def encode_obj_with_fields(
+        self, obj: dict[str, Any], encoded_fields: dict[str, Frame]
+    ) -> Frame:
+        """Encode a message with fields that were already encoded with `encode_obj` added to its payload."""
+
+    @abc.abstractmethod
+    def decode_obj(self, raw: Frame) -> Any:
+        """
+        Raises `ValidationError` if the frame can't be decoded at all.
+        """
+
+    def encode(self, msg: BaseMessage[Any, Any]) -> Frame:
+        return self.encode_obj(msg.dict())
+
+    def encode_model(self, model: BaseModel) -> Frame:
+        """Encode a model that's part of a message, see `encode_with_fields`."""
+        return self.encode_obj(model.dict())
+
+    def encode_with_fields(
+        self, msg: BaseMessage[Any, Any], encoded_fields: dict[str, Frame]
+    ) -> Frame:
+        """Encode the message with fields that were already encoded with `encode_model` added to the payload.
+
+        Use `construct` to create the payload without these fields.
+        """
+        return self.encode_obj_with_fields(
+            msg.dict(exclude={"payload": set(encoded_fields)}), encoded_fields
+        )
+
+    def decode(self, raw: Frame) -> Message:
+        """
+        Raises `ValidationError`.
+        """
+        return Message.parse_obj(self.decode_obj(raw))
+
+
+def _raise_undecodable(exc: Exception) -> NoReturn:
+    # mirror `parse_raw` so callers only have to deal with one exception
+    raise ValidationError([ErrorWrapper(exc, loc="__root__")], Message)
+
+
+class _JsonCodecBase(CodecABC):
+    wire_format = WireFormat.JSON
+
+    def encode_obj_with_fields(
+        self, obj: dict[str, Any], encoded_fields: dict[str, Frame]
+    ) -> Frame:
+        # make sure the payload is the last field
+        encoded = self.encode_obj({"type": obj["type"], "payload": obj["payload"]})
+        assert isinstance(encoded, str)
+        payload_start = encoded.index('"payload":{') + len('"payload":{')
+        fields = ",".join(f'"{key}":{value}' for key, value in encoded_fields.items())
+        if encoded[payload_start] != "}":
+            fields += ","
+        return encoded[:payload_start] + fields + encoded[payload_start:]
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"can't encode {type(obj).__name__}")
+
+
+class JsonCodec(_JsonCodecBase):
+    def encode_obj(self, obj: Any) -> Frame:
+        return json.dumps(obj, separators=(",", ":"), default=_json_default)
+
+    def decode_obj(self, raw: Frame) -> Any:
+        try:
+            return json.loads(raw)
+        except ValueError as exc:
+            _raise_undecodable(exc)
+
+
+class OrjsonCodec(_JsonCodecBase):
+    """Same frames as `JsonCodec`, but a lot faster."""
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise RuntimeError("orjson isn't installed")
+
+    def encode_obj(self, obj: Any) -> Frame:
+        assert orjson is not None
+        # orjson handles UUIDs and enums on its own
+        return orjson.dumps(obj).decode()
+
+    def decode_obj(self, raw: Frame) -> Any:
+        assert orjson is not None
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError as exc:
+            _raise_undecodable(exc)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, uuid.UUID):
+        return obj.bytes
+    raise TypeError(f"can't encode {type(obj).__name__}")
+
+
+class MsgpackCodec(CodecABC):
+    wire_format = WireFormat.MSGPACK
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("msgpack isn't installed")
+
+    def _packer(self) -> Any:
+        assert msgpack is not None
+        return msgpack.Packer(default=_msgpack_default)
+
+    def encode_obj(self, obj: Any) -> Frame:
+        return self._packer().pack(obj)
+
+    def encode_obj_with_fields(
+        self, obj: dict[str, Any], encoded_fields: dict[str, Frame]
+    ) -> Frame:
+        packer = self._packer()
+        payload: dict[str, Any] = obj["payload"]
+        parts = [
+            packer.pack_map_header(2),
+            packer.pack("type"),
+            packer.pack(obj["type"]),
+            packer.pack("payload"),
+            packer.pack_map_header(len(encoded_fields) + len(payload)),
+        ]
+        for key, value in encoded_fields.items():
+            assert isinstance(value, bytes)
+            parts += (packer.pack(key), value)
+        for key, value in payload.items():
+            parts += (packer.pack(key), packer.pack(value))
+        return b"".join(parts)
+
+    def decode_obj(self, raw: Frame) -> Any:
+        assert msgpack is not None
+        try:
+            return msgpack.unpackb(raw)
+        except (ValueError, msgpack.UnpackException) as exc:
+            _raise_undecodable(exc)
+
+
+def _build_codec_by_wire_format() -> dict[WireFormat, CodecABC]:
+    codec_by_wire_format: dict[WireFormat, CodecABC] = {
+        WireFormat.JSON: JsonCodec() if orjson is None else OrjsonCodec()
+    }
+    if msgpack is not None:
+        codec_by_wire_format[WireFormat.MSGPACK] = MsgpackCodec()
+    return codec_by_wire_format
+
+
+# the codec for every wire format that can be used
+CODEC_BY_WIRE_FORMAT: dict[WireFormat, CodecABC] = _build_codec_by_wire_format()
+DEFAULT_CODEC: CodecABC = CODEC_BY_WIRE_FORMAT[WireFormat.JSON]
@@ -0,0 +1,56 @@
+import uuid
+from typing import Any, Iterable
+
+
+def _is_id_field(key: str | None) -> bool:
+    return key is not None and (
+        key == "id" or key.endswith("_id") or key.endswith("_ids")
+    )
+
+
+class CompactIdTable:
+    """Small integer handles for the players and pieces of a game.
+
+    The handle of an id is its index in `ids`. Ids that aren't in the table are left alone.
+    """
+
+    _ids: list[uuid.UUID]
+    _handle_by_id: dict[uuid.UUID, int]
+
+    def __init__(self, ids: Iterable[uuid.UUID]) -> None:
+        self._ids = list(ids)
+        self._handle_by_id = {id_: handle for handle, id_ in enumerate(self._ids)}
+
+    @property
+    def ids(self) -> list[uuid.UUID]:
+        return self._ids
+
+    def compact(self, obj: Any) -> Any:
+        """Replace the ids in the result of `BaseModel.dict()` with their handles."""
+        if isinstance(obj, dict):
+            return {key: self.compact(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [self.compact(value) for value in obj]
+        if isinstance(obj, uuid.UUID):
+            return self._handle_by_id.get(obj, obj)
+        return obj
+
+    def expand(self, obj: Any, *, key: str | None = None) -> Any:
+        """Replace the handles in a decoded message with their ids.
+
+        Only fields named `id`, `*_id` or `*_ids` are considered, unknown handles are left alone.
+        """
+        if isinstance(obj, dict):
+            return {
+                field: self.expand(value, key=field) for field, value in obj.items()
+            }
+        if isinstance(obj, list):
+            return [self.expand(value, key=key) for value in obj]
+        if (
+            isinstance(obj, int)
+            and not isinstance(obj, bool)
+            and _is_id_field(key)
+            and 0 <= obj < len(self._ids)
+        ):
+            return self._ids[obj]
+        return obj
@@ -0,0 +1,82 @@
+"""Compression of large binary frames.
+
+A compressed frame is a MessagePack extension value of type `COMPRESSED_FRAME_EXT_TYPE`
+holding the zlib compressed frame, so clients can tell it apart from a plain message.
+JSON clients rely on the permessage-deflate extension of the websocket server instead.
+"""
+
+import dataclasses
+import os
+import time
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # msgpack isn't installed
+    msgpack = None
+
+COMPRESSED_FRAME_EXT_TYPE: int = 1
+# frames smaller than this many bytes are sent as is
+COMPRESSION_THRESHOLD: int = int(os.environ.get("LD51_COMPRESSION_THRESHOLD", 1024))
+COMPRESSION_LEVEL: int = 6
+
+
+@dataclasses.dataclass()
+class CompressionStats:
+    # frames that reached the threshold
+    frames: int = 0
+    # frames that were sent compressed because it made them smaller
+    compressed_frames: int = 0
+    raw_bytes: int = 0
+    compressed_bytes: int = 0
+    cpu_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """Size of the sent frames relative to their uncompressed size."""
+        if self.raw_bytes == 0:
+            return 1.0
+        return self.compressed_bytes / self.raw_bytes
+
+
+# stats of all frames compressed by this process
+COMPRESSION_STATS = CompressionStats()
+
+
+def compress_frame(
+    frame: bytes,
+    *,
+    threshold: int | None = None,
+    stats: CompressionStats = COMPRESSION_STATS,
+) -> bytes:
+    """Wrap the frame in a compressed envelope if it's large enough and compression pays off."""
+    assert msgpack is not None
+    if threshold is None:
+        threshold = COMPRESSION_THRESHOLD
+    if len(frame) < threshold:
+        return frame
+
+    start = time.thread_time()
+    compressed = msgpack.packb(
+        msgpack.ExtType(
+            COMPRESSED_FRAME_EXT_TYPE, zlib.compress(frame, COMPRESSION_LEVEL)
+        )
+    )
+    stats.cpu_seconds += time.thread_time() - start
+    stats.frames += 1
+    stats.raw_bytes += len(frame)
+    if len(compressed) >= len(frame):
+        stats.compressed_bytes += len(frame)
+        return frame
+    stats.compressed_frames += 1
+    stats.compressed_bytes += len(compressed)
+    return compressed
+
+
+def decompress_frame(frame: bytes) -> bytes:
+    """The plain frame of a frame that may be compressed, this is what clients do."""
+    assert msgpack is not None
+    obj = msgpack.unpackb(frame)
+    if isinstance(obj, msgpack.ExtType) and obj.code == COMPRESSED_FRAME_EXT_TYPE:
+        return zlib.decompress(obj.data)
+    return frame
@@ -1,3 +1,4 @@
+import uuid
 from typing import Literal, Union
 
 from pydantic import BaseModel, Field
@@ -12,7 +13,16 @@ class RoundStartPayload(BaseModel):
         description="Time until the end of the move phase of the round in seconds.",
         ge=0.0,
     )
+    board_version: int = Field(
+        description="Version of the board state at the start of this round.", gt=0
+    )
+    base_board_version: int | None = Field(
+        default=None,
+        description="If set, `board_state` only contains the pieces that changed since this version and `removed_piece_ids` the ones that are gone. "
+        "This is the version the client acknowledged in its last 'ready for next round' message.",
+    )
     board_state: list[PlayerPiecePosition]
+    removed_piece_ids: list[uuid.UUID] = Field(default_factory=list)
 
 
 class RoundStartMessage(BaseMessage[Literal["round_start"], RoundStartPayload]):
@@ -37,7 +47,11 @@ class PlayerMovesMessage(BaseMessage[Literal["player_moves"], PlayerMovesPayload
 
 
 class ReadyForNextRoundPayload(BaseModel):
-    ...
+    board_version: int | None = Field(
+        default=None,
+        description="Version of the board state the client has. "
+        "Acknowledging a version makes the server send only the changes since that version in the next 'round start'.",
+    )
 
 
 class ReadyForNextRoundMessage(
@@ -46,15 +60,38 @@ class ReadyForNextRoundMessage(
     ...
 
 
+class RequestBoardStatePayload(BaseModel):
+    ...
+
+
+class RequestBoardStateMessage(
+    BaseMessage[Literal["request_board_state"], RequestBoardStatePayload]
+):
+    ...
+
+
+class BoardStatePayload(BaseModel):
+    board_version: int = Field(gt=0)
+    board_state: list[PlayerPiecePosition]
+
+
+class BoardStateMessage(BaseMessage[Literal["board_state"], BoardStatePayload]):
+    ...
+
+
 GameLoopMessageType = Union[
+    BoardStateMessage,
     PlayerMovesMessage,
     ReadyForNextRoundMessage,
+    RequestBoardStateMessage,
     RoundResultMessage,
     RoundStartMessage,
 ]
 GameLoopMessagePayloadType = Union[
+    BoardStatePayload,
     PlayerMovesPayload,
     ReadyForNextRoundPayload,
+    RequestBoardStatePayload,
     RoundResultPayload,
     RoundStartPayload,
 ]
@@ -69,6 +106,10 @@ __all__ = [
     "PlayerMovesMessage",
     "ReadyForNextRoundPayload",
     "ReadyForNextRoundMessage",
+    "RequestBoardStatePayload",
+    "RequestBoardStateMessage",
+    "BoardStatePayload",
+    "BoardStateMessage",
     "GameLoopMessageType",
     "GameLoopMessagePayloadType",
 ]
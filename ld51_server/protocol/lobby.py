@@ -52,10 +52,16 @@ class HostStartGameMessage(
 class ServerStartGamePayload(BaseModel):
     platform: BoardPlatform
     players: list[PlayerInfo]
+    board_version: int = Field(description="Version of `pieces`.", gt=0)
     pieces: list[PlayerPiecePosition]
     round_start_in: float = Field(
         description="Time until the first round starts in seconds.", ge=0.0
     )
+    id_handles: list[uuid.UUID] | None = Field(
+        default=None,
+        description="Only sent to clients that joined with `compact_ids`. "
+        "From this message on, players and pieces are referred to by their index in this list instead of their UUID, until the next 'server start game'.",
+    )
 
 
 class ServerStartGameMessage(
@@ -14,8 +14,10 @@ def _make(code: int, reason: str | None) -> Code:
 LOBBY_NOT_JOINABLE = _make(4001, "lobby not joinable")
 LOBBY_NOT_FOUND = _make(4002, "lobby not found")
 LOBBY_SESSION_EXPIRED = _make(4003, "session expired")
+UNSUPPORTED_WIRE_FORMAT = _make(4004, "unsupported wire format")
 
 # lobby state errors
 LOBBY_SHUTDOWN = _make(4101, "lobby shutting down")
 INVALID_MESSAGE = _make(4102, "invalid message")
 NO_MOVES_SUBMITTED = _make(4103, "no moves submitted")
+CLIENT_TOO_SLOW = _make(4104, "client too slow")
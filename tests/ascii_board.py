@@ -5,6 +5,8 @@ from typing import Iterator
 
 from ld51_server.game.board import Board, PieceInformation
 from ld51_server.game.board_platform import RectangleBoardPlatform
+from ld51_server.game.board_storage import BoardStorageMode
+from ld51_server.game.coord import Coord
 from ld51_server.models import PieceAction, PlayerMove, Position, TimelineEventAction
 
 DUMMY_PLAYER_ID = uuid.UUID("00000000-0000-0000-0000-000000000000")
@@ -109,13 +111,16 @@ class AsciiStateAndMoves:
     def render(self, *, with_border: bool = True) -> str:
         return "\n".join(self._iter_rendered_lines(with_border=with_border))
 
-    def to_board_state_and_moves(self) -> BoardStateAndMoves:
+    def to_board_state_and_moves(
+        self, *, storage_mode: BoardStorageMode = BoardStorageMode.AUTO
+    ) -> BoardStateAndMoves:
         state = BoardStateAndMoves(
             board_state=Board(
                 platform=RectangleBoardPlatform(
                     top_left=Position(x=0, y=0),
                     bottom_right=Position(x=self.width - 1, y=self.height - 1),
-                )
+                ),
+                storage_mode=storage_mode,
             ),
             player_moves=[],
         )
@@ -123,9 +128,10 @@ class AsciiStateAndMoves:
             for x, cell in enumerate(row):
                 piece_id = uuid.uuid5(DUMMY_PLAYER_ID, f"{x}:{y}")
                 if cell.has_piece():
-                    state.board_state._piece_by_position[
-                        Position(x=x, y=y)
-                    ] = PieceInformation(player_id=DUMMY_PLAYER_ID, piece_id=piece_id)
+                    state.board_state._place_piece(
+                        Coord(x, y),
+                        PieceInformation(player_id=DUMMY_PLAYER_ID, piece_id=piece_id),
+                    )
                 if move := cell.to_player_move(piece_id):
                     state.player_moves.append(move)
 
@@ -0,0 +1,149 @@
+import enum
+from random import Random
+
+from .ascii_board import AsciiStateAndMoves, BoardCell
+
+_MOVE_CELLS = (
+    BoardCell.MOVE_UP,
+    BoardCell.MOVE_DOWN,
+    BoardCell.MOVE_LEFT,
+    BoardCell.MOVE_RIGHT,
+)
+
+
+class ScenarioKind(str, enum.Enum):
+    # pieces scattered across the board, each with a random move (or none)
+    RANDOM = "random"
+    # rows packed with long chains, each pushed along the row from one of its ends
+    LONG_CHAINS = "long-chains"
+    # full rows of pieces pushing into each other from both ends
+    HEAD_ON_LINES = "head-on-lines"
+    # arms of different lengths pushing towards the same empty cell
+    CONVERGING = "converging"
+    # chains of distinct lengths, every length is resolved in a separate event
+    CASCADE = "cascade"
+
+    def is_single_axis(self) -> bool:
+        """Whether all pushes happen along rows, these never push chains across each other."""
+        match self:
+            case self.RANDOM | self.CONVERGING:
+                return False
+            case _:
+                return True
+
+
+def _empty_grid(width: int, height: int) -> list[list[BoardCell]]:
+    return [[BoardCell.EMPTY] * width for _ in range(height)]
+
+
+def _random(
+    rng: Random, grid: list[list[BoardCell]], density: float
+) -> list[list[BoardCell]]:
+    for row in grid:
+        for x in range(len(row)):
+            if rng.random() < density:
+                row[x] = rng.choice((BoardCell.PIECE, *_MOVE_CELLS))
+    return grid
+
+
+def _long_chains(
+    rng: Random, grid: list[list[BoardCell]], density: float
+) -> list[list[BoardCell]]:
+    for row in grid:
+        x = rng.randrange(2)
+        while x < len(row):
+            length = min(
+                rng.randint(1, max(1, round(len(row) * density))), len(row) - x
+            )
+            row[x : x + length] = [BoardCell.PIECE] * length
+            if rng.random() < 0.5:
+                row[x] = BoardCell.MOVE_RIGHT
+            else:
+                row[x + length - 1] = BoardCell.MOVE_LEFT
+            # leave at least one gap so the chains stay separate
+            x += length + 1 + rng.randrange(2)
+    return grid
+
+
+def _head_on_lines(
+    rng: Random, grid: list[list[BoardCell]], density: float
+) -> list[list[BoardCell]]:
+    for row in grid:
+        if rng.random() >= density * 2:
+            continue
+        row[:] = [BoardCell.PIECE] * len(row)
+        # split the row into segments pushing into each other
+        x = 0
+        while x < len(row):
+            row[x] = BoardCell.MOVE_RIGHT
+            x += rng.randint(2, max(2, len(row) // 4))
+            if x - 1 < len(row):
+                row[x - 1] = BoardCell.MOVE_LEFT
+    return grid
+
+
+def _converging(
+    rng: Random, grid: list[list[BoardCell]], density: float
+) -> list[list[BoardCell]]:
+    height = len(grid)
+    width = len(grid[0]) if grid else 0
+    # the center of every star is an empty cell, the arms push towards it
+    spacing = max(3, round(2 / max(density, 0.01)))
+    for cy in range(spacing // 2, height, spacing):
+        for cx in range(spacing // 2, width, spacing):
+            for dx, dy, cell in (
+                (1, 0, BoardCell.MOVE_LEFT),
+                (-1, 0, BoardCell.MOVE_RIGHT),
+                (0, 1, BoardCell.MOVE_UP),
+                (0, -1, BoardCell.MOVE_DOWN),
+            ):
+                length = rng.randint(1, spacing // 2)
+                for step in range(1, length + 1):
+                    x = cx + dx * step
+                    y = cy + dy * step
+                    if not (0 <= x < width and 0 <= y < height):
+                        break
+                    grid[y][x] = cell if step == length else BoardCell.PIECE
+    return grid
+
+
+def _cascade(
+    rng: Random, grid: list[list[BoardCell]], density: float
+) -> list[list[BoardCell]]:
+    for y, row in enumerate(grid):
+        if rng.random() >= density * 2:
+            continue
+        # chain lengths grow with every row so each one resolves in its own event
+        length = 1 + y % max(1, len(row) - 2)
+        row[0] = BoardCell.MOVE_RIGHT
+        row[1:length] = [BoardCell.PIECE] * (length - 1)
+        # a piece on the other side of the gap competes for the cell in front of the chain
+        if length + 1 < len(row):
+            row[length + 1] = BoardCell.MOVE_LEFT
+    return grid
+
+
+_GENERATOR_BY_KIND = {
+    ScenarioKind.RANDOM: _random,
+    ScenarioKind.LONG_CHAINS: _long_chains,
+    ScenarioKind.HEAD_ON_LINES: _head_on_lines,
+    ScenarioKind.CONVERGING: _converging,
+    ScenarioKind.CASCADE: _cascade,
+}
+
+
+def generate_scenario(
+    kind: ScenarioKind,
+    *,
+    width: int,
+    height: int,
+    seed: int,
+    density: float = 0.3,
+) -> AsciiStateAndMoves:
+    """Generate a board with moves. The same arguments always produce the same scenario.
+
+    `density` between 0 and 1 controls how crowded the board is.
+    """
+    rng = Random(f"{kind.value}:{width}x{height}:{seed}:{density}")
+    grid = _GENERATOR_BY_KIND[kind](rng, _empty_grid(width, height), density)
+    return AsciiStateAndMoves(board_grid=grid, width=width, height=height)
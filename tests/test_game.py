@@ -1,19 +1,46 @@
+import asyncio
+import pickle
 import random
+import uuid
 from pathlib import Path
 
 import pytest
 from pydantic import BaseModel, ValidationError
 
-from ld51_server.models import OutcomeType, TimelineEvent
+import ld51_server.game.board
+from ld51_server.game.board_executor import BoardExecutionMode, get_board_executor
+from ld51_server.game.board_history import BoardStateHistory
+from ld51_server.game.board_platform import (
+    BoardPlatformABC,
+    ClientDefinedPlatform,
+    InfiniteBoardPlatform,
+    RectangleBoardPlatform,
+)
+from ld51_server.game.board_storage import BoardStorageMode
+from ld51_server.game.coord import Coord
+from ld51_server.models import (
+    BoardPlatform,
+    BoardPlatformTile,
+    BoardPlatformTileType,
+    OutcomeType,
+    PlayerPiecePosition,
+    Position,
+    TimelineEvent,
+    TimelineEventAction,
+)
+from ld51_server.protocol.codec import DEFAULT_CODEC, JsonCodec
 
 from . import DATA_DIR
-from .ascii_board import AsciiStateAndMoves
+from .ascii_board import AsciiStateAndMoves, BoardCell
+from .scenario_generator import ScenarioKind, generate_scenario
 
 BOARD_STATES_DIR = DATA_DIR / "board_states"
 
 TIMELINE_FILE_SUFFIX = ".timeline.json"
 BOARD_STATE_FILE_SUFFIX = ".txt"
 
+STORAGE_MODES = [BoardStorageMode.SPARSE, BoardStorageMode.DENSE]
+
 
 def pytest_generate_tests(metafunc: pytest.Metafunc):
     if "board_state_path" in metafunc.fixturenames:
@@ -42,10 +69,11 @@ def _load_before_after(
     return before_state, after_state
 
 
-def test_board_state(board_state_path: Path):
+@pytest.mark.parametrize("storage_mode", STORAGE_MODES)
+def test_board_state(board_state_path: Path, storage_mode: BoardStorageMode):
     board_before, expected_board_after = _load_before_after(board_state_path)
 
-    state_and_moves = board_before.to_board_state_and_moves()
+    state_and_moves = board_before.to_board_state_and_moves(storage_mode=storage_mode)
     random.shuffle(state_and_moves.player_moves)
     state_and_moves.board_state.perform_player_moves(
         state_and_moves.get_validated_moves()
@@ -86,14 +114,15 @@ def _normalize_events(events: list[TimelineEvent]) -> None:
         event.outcomes.sort(key=lambda e: e.json())
 
 
-def test_timeline(timeline_path: Path):
+@pytest.mark.parametrize("storage_mode", STORAGE_MODES)
+def test_timeline(timeline_path: Path, storage_mode: BoardStorageMode):
     board_state_filename = (
         timeline_path.name[: -len(TIMELINE_FILE_SUFFIX)] + BOARD_STATE_FILE_SUFFIX
     )
     board_state_path = timeline_path.with_name(board_state_filename)
     board_before, _ = _load_before_after(board_state_path)
 
-    state_and_moves = board_before.to_board_state_and_moves()
+    state_and_moves = board_before.to_board_state_and_moves(storage_mode=storage_mode)
     random.shuffle(state_and_moves.player_moves)
     events = state_and_moves.board_state.perform_player_moves(
         state_and_moves.get_validated_moves()
@@ -109,3 +138,283 @@ def test_timeline(timeline_path: Path):
 
     timeline_path.write_text(Timeline.parse_obj(events).json(indent=2))
     pytest.fail("updated expected")
+
+
+@pytest.mark.parametrize("storage_mode", STORAGE_MODES)
+def test_piece_index(board_state_path: Path, storage_mode: BoardStorageMode):
+    board_before, _ = _load_before_after(board_state_path)
+
+    state_and_moves = board_before.to_board_state_and_moves(storage_mode=storage_mode)
+    board = state_and_moves.board_state
+    board.perform_player_moves(state_and_moves.get_validated_moves())
+
+    pieces = board.get_pieces_model()
+    for piece in pieces:
+        assert board.get_piece_by_id(piece.piece_id) == piece
+    assert board._get_remaining_player_ids() == {piece.player_id for piece in pieces}
+
+
+@pytest.mark.parametrize("storage_mode", STORAGE_MODES)
+def test_board_snapshot(board_state_path: Path, storage_mode: BoardStorageMode):
+    board_before, expected_board_after = _load_before_after(board_state_path)
+
+    state_and_moves = board_before.to_board_state_and_moves(storage_mode=storage_mode)
+    board = state_and_moves.board_state
+    moves = state_and_moves.get_validated_moves()
+
+    def render(board: ld51_server.game.board.Board) -> str:
+        return AsciiStateAndMoves.from_board_state(
+            board, width=expected_board_after.width, height=expected_board_after.height
+        ).render()
+
+    ascii_before = render(board)
+    fork = board.snapshot()
+    # forking the fork stacks another layer on top
+    fork_of_fork = fork.snapshot()
+
+    fork.perform_player_moves(moves)
+    assert render(fork) == expected_board_after.render()
+    assert render(board) == ascii_before
+    assert render(fork_of_fork) == ascii_before
+
+    board.perform_player_moves(moves)
+    assert render(board) == expected_board_after.render()
+    assert render(fork_of_fork) == ascii_before
+    assert (
+        board._get_remaining_player_ids()
+        == fork._get_remaining_player_ids()
+        == {piece.player_id for piece in board.get_pieces_model()}
+    )
+
+
+@pytest.mark.parametrize("mode", list(BoardExecutionMode))
+def test_board_executor(board_state_path: Path, mode: BoardExecutionMode):
+    board_before, expected_board_after = _load_before_after(board_state_path)
+
+    state_and_moves = board_before.to_board_state_and_moves()
+    moves_by_player: dict[uuid.UUID, list[TimelineEventAction]] = {}
+    for move in state_and_moves.get_validated_moves():
+        moves_by_player.setdefault(move.player_id, []).append(move)
+
+    board, _ = asyncio.run(
+        get_board_executor(mode).perform_all_player_moves(
+            state_and_moves.board_state, moves_by_player
+        )
+    )
+    got_board_after = AsciiStateAndMoves.from_board_state(
+        board, width=expected_board_after.width, height=expected_board_after.height
+    )
+    assert got_board_after.render() == expected_board_after.render()
+
+
+def test_client_defined_platform_bounds():
+    # 3x2 platform with a void tile in the middle of the top row
+    tiles = [
+        BoardPlatformTile(
+            position=Position(x=x, y=y),
+            texture_id="unknown",
+            tile_type=BoardPlatformTileType.VOID
+            if (x, y) == (1, 0)
+            else BoardPlatformTileType.FLOOR,
+        )
+        for x in range(-1, 2)
+        for y in range(2)
+    ]
+    platform = ClientDefinedPlatform(BoardPlatform(tiles=tiles))
+
+    assert platform.get_bounds() == (Coord(-1, 0), Coord(1, 1))
+    assert platform.on_board_positions() == 5
+    for tile in tiles:
+        assert platform.is_position_on_board(Coord.from_position(tile.position)) == (
+            tile.tile_type == BoardPlatformTileType.FLOOR
+        )
+    assert not platform.is_position_on_board(Coord(2, 0))
+    assert not platform.is_position_on_board(Coord(0, -1))
+    # tiles are listed row by row
+    assert platform.to_model().tiles == sorted(
+        tiles, key=lambda tile: (tile.position.y, tile.position.x)
+    )
+    assert BoardPlatform.parse_raw(platform.encode_model(JsonCodec())) == (
+        platform.to_model()
+    )
+    # the encoding is cached but not pickled
+    assert platform.encode_model(DEFAULT_CODEC) is platform.encode_model(DEFAULT_CODEC)
+    assert not pickle.loads(pickle.dumps(platform)).__dict__.get(
+        "_encoded_model_by_codec"
+    )
+
+
+@pytest.mark.parametrize(
+    "platform",
+    [
+        InfiniteBoardPlatform(),
+        RectangleBoardPlatform(
+            top_left=Position(x=-3, y=2), bottom_right=Position(x=4, y=6)
+        ),
+        ClientDefinedPlatform(
+            BoardPlatform(
+                tiles=[
+                    BoardPlatformTile(
+                        position=Position(x=x, y=y),
+                        texture_id="unknown",
+                        tile_type=BoardPlatformTileType.VOID
+                        if (x + y) % 3 == 0
+                        else BoardPlatformTileType.FLOOR,
+                    )
+                    for x in range(8)
+                    for y in range(5)
+                ]
+            )
+        ),
+    ],
+    ids=lambda platform: type(platform).__name__,
+)
+def test_sample_positions(platform: BoardPlatformABC):
+    rng = random.Random(51)
+    k = platform.on_board_positions() or 100
+    positions = platform.sample_positions(rng, k)
+    assert len(set(positions)) == k
+    assert all(platform.is_position_on_board(pos) for pos in positions)
+
+    if platform.on_board_positions() is not None:
+        with pytest.raises(ValueError):
+            platform.sample_positions(rng, k + 1)
+
+    board = ld51_server.game.board.Board(platform=platform)
+    player_ids = [uuid.uuid4() for _ in range(3)]
+    board.place_pieces(rng, player_ids, 4)
+    pieces = board.get_pieces_model()
+    assert len(pieces) == 12
+    assert board._get_remaining_player_ids() == set(player_ids)
+
+
+def _perform_moves_with_resolver(
+    board_before: AsciiStateAndMoves,
+    monkeypatch: pytest.MonkeyPatch,
+    *,
+    vectorized: bool,
+) -> tuple[list[TimelineEvent], str]:
+    monkeypatch.setattr(
+        ld51_server.game.board,
+        "VECTORIZED_MIN_MOVES",
+        0 if vectorized else 1 << 30,
+    )
+    state_and_moves = board_before.to_board_state_and_moves(
+        storage_mode=BoardStorageMode.DENSE
+    )
+    events = state_and_moves.board_state.perform_player_moves(
+        state_and_moves.get_validated_moves()
+    )
+    board_after = AsciiStateAndMoves.from_board_state(
+        state_and_moves.board_state,
+        width=board_before.width,
+        height=board_before.height,
+    )
+    return events, board_after.render()
+
+
+def _random_ascii_board(seed: int) -> AsciiStateAndMoves:
+    rng = random.Random(seed)
+    width = rng.randint(1, 30)
+    height = rng.randint(1, 30)
+    # only horizontal moves, see `benchmarks/board_scaling.py`
+    cells = [
+        BoardCell.EMPTY,
+        BoardCell.PIECE,
+        BoardCell.MOVE_LEFT,
+        BoardCell.MOVE_RIGHT,
+    ]
+    raw = "\n".join(
+        "".join(rng.choices(cells, weights=[5, 2, 1, 1])[0].value for _ in range(width))
+        for _ in range(height)
+    )
+    return AsciiStateAndMoves.parse(raw)
+
+
+def test_vectorized_resolver(board_state_path: Path, monkeypatch: pytest.MonkeyPatch):
+    if ld51_server.game.board.board_vectorized is None:
+        pytest.skip("numpy isn't installed")
+
+    board_before, _ = _load_before_after(board_state_path)
+    expected = _perform_moves_with_resolver(board_before, monkeypatch, vectorized=False)
+    got = _perform_moves_with_resolver(board_before, monkeypatch, vectorized=True)
+    assert got == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_vectorized_resolver_random(seed: int, monkeypatch: pytest.MonkeyPatch):
+    if ld51_server.game.board.board_vectorized is None:
+        pytest.skip("numpy isn't installed")
+
+    board_before = _random_ascii_board(seed)
+    expected = _perform_moves_with_resolver(board_before, monkeypatch, vectorized=False)
+    got = _perform_moves_with_resolver(board_before, monkeypatch, vectorized=True)
+    assert got == expected
+
+
+def test_scenario_generator_is_reproducible():
+    for kind in ScenarioKind:
+        scenario = generate_scenario(kind, width=40, height=30, seed=7)
+        assert scenario.render() == (
+            generate_scenario(kind, width=40, height=30, seed=7).render()
+        )
+        assert scenario.render() != (
+            generate_scenario(kind, width=40, height=30, seed=8).render()
+        )
+
+
+@pytest.mark.parametrize(
+    "kind", [kind for kind in ScenarioKind if kind.is_single_axis()]
+)
+@pytest.mark.parametrize("seed", range(3))
+def test_generated_scenario(
+    kind: ScenarioKind, seed: int, monkeypatch: pytest.MonkeyPatch
+):
+    board_before = generate_scenario(kind, width=40, height=20, seed=seed)
+
+    state_and_moves = board_before.to_board_state_and_moves(
+        storage_mode=BoardStorageMode.SPARSE
+    )
+    events = state_and_moves.board_state.perform_player_moves(
+        state_and_moves.get_validated_moves()
+    )
+    board_after = AsciiStateAndMoves.from_board_state(
+        state_and_moves.board_state,
+        width=board_before.width,
+        height=board_before.height,
+    )
+    expected = (events, board_after.render())
+
+    assert (
+        _perform_moves_with_resolver(board_before, monkeypatch, vectorized=False)
+        == expected
+    )
+    if ld51_server.game.board.board_vectorized is not None:
+        assert (
+            _perform_moves_with_resolver(board_before, monkeypatch, vectorized=True)
+            == expected
+        )
+
+
+def test_board_state_history():
+    player_id = uuid.uuid4()
+    pieces = [
+        PlayerPiecePosition(
+            player_id=player_id, piece_id=uuid.uuid4(), position=Position(x=x, y=0)
+        )
+        for x in range(3)
+    ]
+    history = BoardStateHistory(pieces, max_versions=2)
+    assert history.version == 1
+    assert history.diff(1) == ([], [])
+
+    moved = pieces[0].copy(update={"position": Position(x=0, y=1)})
+    assert history.push([moved, pieces[1]]) == 2
+    assert history.pieces == [moved, pieces[1]]
+    assert history.diff(1) == ([moved], [pieces[2].piece_id])
+
+    history.push([moved])
+    # version 1 was dropped
+    assert history.diff(1) is None
+    assert history.diff(2) == ([], [pieces[1].piece_id])
+    assert history.diff(4) is None
@@ -1,13 +1,17 @@
 import contextlib
+import json
 import time
 import uuid
 from typing import Any, Type, TypeVar
 
+import pytest
 import starlette.types
 from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
 from starlette.testclient import TestClient, WebSocketTestSession
 
 from ld51_server import app
+from ld51_server.game.board_executor import BoardExecutionMode
 from ld51_server.models import (
     BoardPlatform,
     BoardPlatformTile,
@@ -15,6 +19,7 @@ from ld51_server.models import (
     Direction,
     GameOver,
     PieceAction,
+    PlayerInfo,
     PlayerMove,
     Position,
     PushOutcome,
@@ -24,6 +29,8 @@ from ld51_server.models import (
 )
 from ld51_server.protocol import (
     BaseMessage,
+    BoardStatePayload,
+    ErrorPayload,
     HostStartGameMessage,
     HostStartGamePayload,
     Message,
@@ -34,11 +41,29 @@ from ld51_server.protocol import (
     PlayerMovesPayload,
     ReadyForNextRoundMessage,
     ReadyForNextRoundPayload,
+    RequestBoardStateMessage,
+    RequestBoardStatePayload,
     RoundResultPayload,
     RoundStartPayload,
     ServerHelloPayload,
+    ServerStartGameMessage,
     ServerStartGamePayload,
 )
+from ld51_server.protocol import codec as codec_module
+from ld51_server.protocol.codec import (
+    CodecABC,
+    Frame,
+    JsonCodec,
+    MsgpackCodec,
+    OrjsonCodec,
+    WireFormat,
+)
+from ld51_server.protocol.compact_ids import CompactIdTable
+from ld51_server.protocol.compression import (
+    CompressionStats,
+    compress_frame,
+    decompress_frame,
+)
 
 _DEFAULT_TIMEOUT: float = 0.2  # 200 ms
 
@@ -61,14 +86,25 @@ def _lobby_connect_ws(
     lobby_id: str,
     *,
     session_id: str | None = None,
+    encoding: str | None = None,
+    compact_ids: bool = False,
+    compression: bool = False,
+    subprotocols: list[str] | None = None,
     timeout: float = 0.5,
 ) -> WebSocketTestSession:
     params = {}
     if session_id is not None:
         params["session_id"] = session_id
+    if encoding is not None:
+        params["encoding"] = encoding
+    if compact_ids:
+        params["compact_ids"] = "true"
+    if compression:
+        params["compression"] = "true"
     ws: WebSocketTestSession = client.websocket_connect(
         f"/lobby/{lobby_id}/join",
         params=params,
+        subprotocols=subprotocols,
         timeout=timeout,
     )
 
@@ -116,6 +152,330 @@ def _rx_msg_payload_type(
     return payload
 
 
+_CODECS = [
+    JsonCodec(),
+    *([OrjsonCodec()] if codec_module.orjson is not None else []),
+    *([MsgpackCodec()] if codec_module.msgpack is not None else []),
+]
+
+
+@pytest.mark.parametrize("codec", _CODECS, ids=lambda codec: type(codec).__name__)
+def test_codec(codec: CodecABC):
+    piece_id = uuid.uuid4()
+    msg = PlayerMovesMessage.from_payload(
+        PlayerMovesPayload(
+            moves=[
+                PlayerMove(piece_id=piece_id, action=PieceAction.MOVE_UP),
+                PlayerMove(piece_id=uuid.uuid4(), action=PieceAction.NO_ACTION),
+            ]
+        )
+    )
+    encoded = codec.encode(msg)
+    assert codec.decode(encoded).__root__ == msg
+
+    match codec.wire_format:
+        case WireFormat.JSON:
+            assert isinstance(encoded, str)
+            assert json.loads(encoded) == jsonable_encoder(msg)
+            assert codec.decode(encoded.encode()).__root__ == msg
+            invalid_frames: list[Frame] = [
+                "{not json",
+                '{"type": "unknown", "payload": {}}',
+            ]
+        case WireFormat.MSGPACK:
+            assert isinstance(encoded, bytes)
+            raw_moves = codec_module.msgpack.unpackb(encoded)["payload"]["moves"]
+            # UUIDs are sent as raw bytes
+            assert raw_moves[0]["piece_id"] == piece_id.bytes
+            invalid_frames = [
+                b"\xc1",
+                encoded[:-1],
+                codec_module.msgpack.packb({"type": "unknown", "payload": {}}),
+            ]
+
+    for frame in invalid_frames:
+        with pytest.raises(ValidationError):
+            codec.decode(frame)
+
+
+@pytest.mark.parametrize("codec", _CODECS, ids=lambda codec: type(codec).__name__)
+def test_codec_encode_with_fields(codec: CodecABC):
+    platform = BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=0),
+                texture_id="unknown",
+                tile_type=BoardPlatformTileType.FLOOR,
+            )
+            for x in range(4)
+        ]
+    )
+    payload = ServerStartGamePayload(
+        platform=platform,
+        players=[PlayerInfo(id=uuid.uuid4(), number=1)],
+        board_version=1,
+        pieces=[],
+        round_start_in=5.0,
+    )
+    msg = ServerStartGameMessage.construct(
+        type=ServerStartGameMessage.get_type_value(),
+        payload=ServerStartGamePayload.construct(**payload.dict(exclude={"platform"})),
+    )
+    encoded = codec.encode_with_fields(msg, {"platform": codec.encode_model(platform)})
+    assert codec.decode(encoded).payload == payload
+
+
+@pytest.mark.skipif(codec_module.msgpack is None, reason="msgpack isn't installed")
+def test_mixed_wire_formats(monkeypatch: pytest.MonkeyPatch):
+    client = TestClient(app)
+    lobby_id = _create_lobby_get_lobby_id(client)
+
+    import ld51_server.game.lobby
+
+    monkeypatch.setattr(ld51_server.game.lobby, "PRE_GAME_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "ROUND_DURATION", 1.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "PLAYER_RECONNECT_DURATION", 0.5)
+
+    msgpack_codec = MsgpackCodec()
+
+    def _rx_msgpack_payload(ws: WebSocketTestSession) -> MessagePayloadType:
+        return msgpack_codec.decode(ws.receive_bytes()).payload
+
+    with contextlib.ExitStack() as exit_stack:
+        ws1 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, subprotocols=["ld51.json"])
+        )
+        assert ws1.accepted_subprotocol == "ld51.json"
+        _rx_msg_payload_type(ws1, ServerHelloPayload)
+
+        ws2 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, encoding="msgpack")
+        )
+        assert ws2.accepted_subprotocol is None
+        assert isinstance(_rx_msgpack_payload(ws2), ServerHelloPayload)
+        _rx_msg_payload_type(ws1, PlayerJoinedPayload)
+
+        platform = BoardPlatform(
+            tiles=[
+                BoardPlatformTile(
+                    position=Position(x=x, y=0),
+                    texture_id="unknown",
+                    tile_type=BoardPlatformTileType.FLOOR,
+                )
+                for x in range(4)
+            ]
+        )
+        _tx_msg(
+            ws1,
+            HostStartGameMessage.from_payload(HostStartGamePayload(platform=platform)),
+        )
+        ws1_data = _rx_msg_payload_type(ws1, ServerStartGamePayload)
+        assert ws1_data.platform == platform
+        assert _rx_msgpack_payload(ws2) == ws1_data
+
+        round_start = _rx_msg_payload_type(ws1, RoundStartPayload)
+        assert _rx_msgpack_payload(ws2) == round_start
+
+        # messages from the client are decoded with the same format
+        ws2.send_bytes(
+            msgpack_codec.encode(
+                ReadyForNextRoundMessage.from_payload(ReadyForNextRoundPayload())
+            )
+        )
+        error = _rx_msgpack_payload(ws2)
+        assert isinstance(error, ErrorPayload)
+        assert error == ErrorPayload.invalid_lobby_state()
+
+
+@pytest.mark.skipif(codec_module.msgpack is None, reason="msgpack isn't installed")
+def test_compress_frame():
+    stats = CompressionStats()
+    small = b"\x81\xa4type\xa4ping"
+    assert compress_frame(small, threshold=64, stats=stats) is small
+    assert stats.frames == 0
+
+    large = codec_module.msgpack.packb({"type": "round_result", "payload": "x" * 256})
+    compressed = compress_frame(large, threshold=64, stats=stats)
+    assert len(compressed) < len(large)
+    assert decompress_frame(compressed) == large
+    assert decompress_frame(large) == large
+    assert stats.compressed_frames == 1
+    assert stats.ratio == len(compressed) / len(large)
+
+    # frames that don't get smaller are sent as is
+    incompressible = b"".join(uuid.uuid4().bytes for _ in range(8))
+    assert compress_frame(incompressible, threshold=64, stats=stats) is incompressible
+    assert (stats.frames, stats.compressed_frames) == (2, 1)
+    assert stats.raw_bytes == len(large) + len(incompressible)
+
+
+@pytest.mark.skipif(codec_module.msgpack is None, reason="msgpack isn't installed")
+def test_compression(monkeypatch: pytest.MonkeyPatch):
+    client = TestClient(app)
+    lobby_id = _create_lobby_get_lobby_id(client)
+
+    import ld51_server.game.lobby
+
+    monkeypatch.setattr(ld51_server.game.lobby, "PRE_GAME_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "ROUND_DURATION", 1.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "PLAYER_RECONNECT_DURATION", 0.5)
+
+    msgpack_codec = MsgpackCodec()
+    platform = BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=y),
+                texture_id="unknown",
+                tile_type=BoardPlatformTileType.FLOOR,
+            )
+            for x in range(20)
+            for y in range(20)
+        ]
+    )
+
+    with contextlib.ExitStack() as exit_stack:
+        ws1 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, encoding="msgpack")
+        )
+        msgpack_codec.decode(ws1.receive_bytes())
+        ws2 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, encoding="msgpack", compression=True)
+        )
+        # small frames are sent as is
+        hello = ws2.receive_bytes()
+        assert decompress_frame(hello) == hello
+        msgpack_codec.decode(ws1.receive_bytes())
+        # compression is up to permessage-deflate for JSON clients
+        ws3 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, compression=True)
+        )
+        _rx_msg_payload_type(ws3, ServerHelloPayload)
+        ws1.receive_bytes()
+        ws2.receive_bytes()
+
+        ws1.send_bytes(
+            msgpack_codec.encode(
+                HostStartGameMessage.from_payload(
+                    HostStartGamePayload(platform=platform)
+                )
+            )
+        )
+        plain = ws1.receive_bytes()
+        compressed = ws2.receive_bytes()
+        assert len(compressed) < len(plain) / 4
+        assert decompress_frame(compressed) == plain
+        assert (
+            _rx_msg_payload_type(ws3, ServerStartGamePayload)
+            == msgpack_codec.decode(plain).payload
+        )
+
+    resp = client.get("/dev-tools/metrics/compression", timeout=_DEFAULT_TIMEOUT)
+    assert resp.json()["compressed_frames"] >= 1
+
+
+def test_compact_id_table():
+    ids = [uuid.uuid4() for _ in range(3)]
+    unknown_id = uuid.uuid4()
+    table = CompactIdTable(ids)
+
+    obj = {
+        "player_id": ids[0],
+        "session_id": unknown_id,
+        "victim_piece_ids": [ids[2], ids[1]],
+        "position": {"x": 1, "y": 2},
+    }
+    compact = table.compact(obj)
+    assert compact == {
+        "player_id": 0,
+        "session_id": unknown_id,
+        "victim_piece_ids": [2, 1],
+        "position": {"x": 1, "y": 2},
+    }
+    assert table.expand(compact) == obj
+    # only id fields are expanded, and only known handles
+    assert table.expand({"piece_id": 3, "round_number": 1, "id": True}) == {
+        "piece_id": 3,
+        "round_number": 1,
+        "id": True,
+    }
+
+
+def test_compact_ids(monkeypatch: pytest.MonkeyPatch):
+    client = TestClient(app)
+    lobby_id = _create_lobby_get_lobby_id(client)
+
+    import ld51_server.game.lobby
+
+    monkeypatch.setattr(ld51_server.game.lobby, "PRE_GAME_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "ROUND_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "PLAYER_RECONNECT_DURATION", 0.5)
+
+    id_table: CompactIdTable | None = None
+
+    def _rx_compact_payload(ws: WebSocketTestSession) -> MessagePayloadType:
+        nonlocal id_table
+        obj = json.loads(ws.receive_text())
+        if id_handles := obj["payload"].get("id_handles"):
+            id_table = CompactIdTable(uuid.UUID(id_) for id_ in id_handles)
+        if id_table is not None:
+            obj = id_table.expand(obj)
+        return Message.parse_obj(obj).payload
+
+    platform = BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=y),
+                texture_id="unknown",
+                tile_type=BoardPlatformTileType.FLOOR,
+            )
+            for x in range(10)
+            for y in range(10)
+        ]
+    )
+
+    with contextlib.ExitStack() as exit_stack:
+        ws1 = exit_stack.enter_context(_lobby_connect_ws(client, lobby_id))
+        _rx_msg_payload_type(ws1, ServerHelloPayload)
+        ws2 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, compact_ids=True)
+        )
+        ws2_player_id = _rx_msg_payload_type(ws2, ServerHelloPayload).player.id
+        _rx_msg_payload_type(ws1, PlayerJoinedPayload)
+
+        _tx_msg(
+            ws1,
+            HostStartGameMessage.from_payload(HostStartGamePayload(platform=platform)),
+        )
+        ws1_data = _rx_msg_payload_type(ws1, ServerStartGamePayload)
+        assert ws1_data.id_handles is None
+        ws2_data = _rx_compact_payload(ws2)
+        assert isinstance(ws2_data, ServerStartGamePayload)
+        assert id_table is not None
+        assert ws2_data == ws1_data.copy(update={"id_handles": id_table.ids})
+        # the players come first
+        assert id_table.ids[:2] == [player.id for player in ws1_data.players]
+
+        round_start = _rx_msg_payload_type(ws1, RoundStartPayload)
+        assert _rx_compact_payload(ws2) == round_start
+
+        # the client refers to its pieces by their handles as well
+        moves = [
+            {"piece_id": id_table.ids.index(piece.piece_id), "action": "move_up"}
+            for piece in round_start.board_state
+            if piece.player_id == ws2_player_id
+        ]
+        ws2.send_json({"type": "player_moves", "payload": {"moves": moves}})
+        _tx_msg(ws1, PlayerMovesMessage.from_payload(PlayerMovesPayload(moves=[])))
+
+        round_result = _rx_msg_payload_type(ws1, RoundResultPayload)
+        assert {
+            action.piece_id
+            for event in round_result.timeline
+            for action in event.actions
+        } == {id_table.ids[move["piece_id"]] for move in moves}
+        assert _rx_compact_payload(ws2) == round_result
+
+
 def test_join_two_players():
     client = TestClient(app)
     lobby_id = _create_lobby_get_lobby_id(client)
@@ -221,6 +581,152 @@ def test_player_reconnect():
         assert data.reconnect is True
 
 
+def test_player_reconnect_during_game(monkeypatch: pytest.MonkeyPatch):
+    client = TestClient(app)
+    lobby_id = _create_lobby_get_lobby_id(client)
+
+    import ld51_server.game.lobby
+
+    # keep the game in the pre-game phase for the whole test
+    monkeypatch.setattr(ld51_server.game.lobby, "PRE_GAME_DURATION", 1.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "PLAYER_RECONNECT_DURATION", 1.0)
+
+    platform = BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=0),
+                texture_id="unknown",
+                tile_type=BoardPlatformTileType.FLOOR,
+            )
+            for x in range(4)
+        ]
+    )
+
+    with contextlib.ExitStack() as exit_stack:
+        ws1 = exit_stack.enter_context(_lobby_connect_ws(client, lobby_id))
+        _rx_msg_payload_type(ws1, ServerHelloPayload)
+        ws2 = exit_stack.enter_context(_lobby_connect_ws(client, lobby_id))
+        session_id = _rx_msg_payload_type(ws2, ServerHelloPayload).session_id
+        _rx_msg_payload_type(ws1, PlayerJoinedPayload)
+
+        _tx_msg(
+            ws1,
+            HostStartGameMessage.from_payload(HostStartGamePayload(platform=platform)),
+        )
+        start_data = _rx_msg_payload_type(ws1, ServerStartGamePayload)
+        assert _rx_msg_payload_type(ws2, ServerStartGamePayload) == start_data
+
+        ws2.close()
+        ws2 = exit_stack.enter_context(
+            _lobby_connect_ws(client, lobby_id, session_id=str(session_id))
+        )
+        _rx_msg_payload_type(ws2, ServerHelloPayload)
+        data = _rx_msg_payload_type(ws2, ServerStartGamePayload)
+        assert data.platform == platform
+        assert data.players == start_data.players
+        assert data.pieces == start_data.pieces
+        assert 0.0 < data.round_start_in <= start_data.round_start_in
+
+        assert _rx_msg_payload_type(ws1, PlayerJoinedPayload).reconnect is True
+
+
+def test_delta_board_state(monkeypatch: pytest.MonkeyPatch):
+    client = TestClient(app)
+    lobby_id = _create_lobby_get_lobby_id(client)
+
+    import ld51_server.game.lobby
+
+    monkeypatch.setattr(ld51_server.game.lobby, "PRE_GAME_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "ROUND_DURATION", 0.0)
+    monkeypatch.setattr(ld51_server.game.lobby, "PLAYER_RECONNECT_DURATION", 0.5)
+
+    platform = BoardPlatform(
+        tiles=[
+            BoardPlatformTile(
+                position=Position(x=x, y=y),
+                texture_id="unknown",
+                tile_type=BoardPlatformTileType.FLOOR,
+            )
+            for x in range(10)
+            for y in range(10)
+        ]
+    )
+
+    with contextlib.ExitStack() as exit_stack:
+        ws1 = exit_stack.enter_context(_lobby_connect_ws(client, lobby_id))
+        ws1_player_id = _rx_msg_payload_type(ws1, ServerHelloPayload).player.id
+        ws2 = exit_stack.enter_context(_lobby_connect_ws(client, lobby_id))
+        _rx_msg_payload_type(ws2, ServerHelloPayload)
+        _rx_msg_payload_type(ws1, PlayerJoinedPayload)
+
+        _tx_msg(
+            ws1,
+            HostStartGameMessage.from_payload(HostStartGamePayload(platform=platform)),
+        )
+        start_data = _rx_msg_payload_type(ws1, ServerStartGamePayload)
+        _rx_msg_payload_type(ws2, ServerStartGamePayload)
+
+        # nobody acknowledged a version yet, so everyone gets the full board state
+        ws1_data = _rx_msg_payload_type(ws1, RoundStartPayload)
+        assert ws1_data.board_version == start_data.board_version
+        assert ws1_data.base_board_version is None
+        assert ws1_data.board_state == start_data.pieces
+        assert _rx_msg_payload_type(ws2, RoundStartPayload) == ws1_data
+
+        # move every piece of player 1 towards the middle of the platform
+        _tx_msg(
+            ws1,
+            PlayerMovesMessage.from_payload(
+                PlayerMovesPayload(
+                    moves=[
+                        PlayerMove(
+                            piece_id=piece.piece_id,
+                            action=PieceAction.MOVE_RIGHT
+                            if piece.position.x < 5
+                            else PieceAction.MOVE_LEFT,
+                        )
+                        for piece in ws1_data.board_state
+                        if piece.player_id == ws1_player_id
+                    ]
+                )
+            ),
+        )
+        _tx_msg(ws2, PlayerMovesMessage.from_payload(PlayerMovesPayload(moves=[])))
+        assert _rx_msg_payload_type(ws1, RoundResultPayload).game_over is None
+        _rx_msg_payload_type(ws2, RoundResultPayload)
+
+        # only player 1 acknowledges the version it has
+        _tx_msg(
+            ws1,
+            ReadyForNextRoundMessage.from_payload(
+                ReadyForNextRoundPayload(board_version=ws1_data.board_version)
+            ),
+        )
+        _tx_msg(ws2, ReadyForNextRoundMessage.from_payload(ReadyForNextRoundPayload()))
+
+        ws2_data = _rx_msg_payload_type(ws2, RoundStartPayload)
+        assert ws2_data.board_version == ws1_data.board_version + 1
+        assert ws2_data.base_board_version is None
+
+        delta = _rx_msg_payload_type(ws1, RoundStartPayload)
+        assert delta.board_version == ws2_data.board_version
+        assert delta.base_board_version == ws1_data.board_version
+        assert 0 < len(delta.board_state) < len(ws2_data.board_state)
+        piece_by_id = {piece.piece_id: piece for piece in ws1_data.board_state}
+        for piece_id in delta.removed_piece_ids:
+            del piece_by_id[piece_id]
+        piece_by_id.update((piece.piece_id, piece) for piece in delta.board_state)
+        assert sorted(piece_by_id.values(), key=lambda piece: piece.piece_id) == (
+            sorted(ws2_data.board_state, key=lambda piece: piece.piece_id)
+        )
+
+        # the full board state can be requested at any time
+        _tx_msg(ws1, RequestBoardStateMessage.from_payload(RequestBoardStatePayload()))
+        board_state_data = _rx_msg_payload_type(ws1, BoardStatePayload)
+        assert board_state_data.board_version == ws2_data.board_version
+        assert board_state_data.board_state == ws2_data.board_state
+
+
 def _game_first_round(
     ws1: WebSocketTestSession, ws2: WebSocketTestSession, *, ws1_player_id: uuid.UUID
 ) -> None:
@@ -335,7 +841,8 @@ def _game_second_round(
     )
 
 
-def test_game():
+@pytest.mark.parametrize("mode", list(BoardExecutionMode))
+def test_game(mode: BoardExecutionMode):
     client = TestClient(app)
     lobby_id = _create_lobby_get_lobby_id(client)
 
@@ -343,6 +850,7 @@ def test_game():
 
     ld51_server.game.lobby.ROUND_DURATION = 0.0
     ld51_server.game.lobby.PRE_GAME_DURATION = 0.0
+    ld51_server.game.lobby.BOARD_EXECUTION_MODE = mode
 
     with _lobby_connect_ws(client, lobby_id) as ws1:
         ws1_data = _rx_msg_payload_type(ws1, ServerHelloPayload)